@@ -0,0 +1,24 @@
+import datetime
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+def validators(*parts):
+    """Strong ETag and Last-Modified timestamp for a representation built from parts"""
+    # The ETag hashes every part; Last-Modified is the latest datetime among them
+    digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    times = [part for part in parts if isinstance(part, datetime.datetime)]
+    return f'"{digest}"', int(max(times).timestamp()) if times else None
+
+def not_modified(request, etag, last_modified):
+    """A 304 (or 412) when the request's preconditions already match, else None"""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+def set_validators(response, etag, last_modified):
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,79 @@
+import io
+from PIL import Image, ImageOps
+
+# Pure image functions, safe to run in a worker process without Django set up
+
+# Bounding box (width, height) per rendition; images are scaled down, never up
+RENDITION_SIZES = {
+    'thumb': (320, 240),
+    'card': (640, 480),
+    'full': (1600, 1200),
+}
+# Square avatar sizes, centre-cropped
+AVATAR_SIZES = {
+    'small': (96, 96),
+    'medium': (200, 200),
+    'large': (400, 400),
+}
+# Pillow format, file extension and encoder options per output format
+RENDITION_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+
+def rendition_key(size, fmt):
+    return f'{size}.{fmt}'
+
+def rendition_extension(key):
+    return RENDITION_FORMATS[key.split('.')[1]][1]
+
+def _flatten(image):
+    """An RGB copy of image, with any transparency composited onto white"""
+    if image.mode == 'RGB':
+        return image
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+def render(data, sizes=None, crop=False):
+    """Encode every size and format of an image; returns {'card.webp': bytes, ...}"""
+    sizes = sizes or RENDITION_SIZES
+    with Image.open(io.BytesIO(data)) as source:
+        source = _flatten(ImageOps.exif_transpose(source))
+        outputs = {}
+        for size, box in sizes.items():
+            if crop:
+                image = ImageOps.fit(source, box, Image.Resampling.LANCZOS)
+            else:
+                image = source.copy()
+                image.thumbnail(box, Image.Resampling.LANCZOS)
+            for fmt, (pil_format, _, options) in RENDITION_FORMATS.items():
+                buffer = io.BytesIO()
+                image.save(buffer, pil_format, **options)
+                outputs[rendition_key(size, fmt)] = buffer.getvalue()
+    return outputs
+
+def render_avatars(data):
+    """Encode the square avatar sizes of a profile picture"""
+    return render(data, AVATAR_SIZES, crop=True)
+
+def rendition_urls(storage, original, renditions, sizes=None):
+    """URLs per size and format; JPEG falls back to the original until renditions exist"""
+    sizes = sizes or RENDITION_SIZES
+    original_url = storage.url(original) if original else None
+    if renditions.get('source') != original:
+        # Made from a file that has since been replaced
+        renditions = {}
+    urls = {'original': original_url}
+    for size in sizes:
+        urls[size] = {}
+        for fmt in RENDITION_FORMATS:
+            name = renditions.get(rendition_key(size, fmt))
+            if name:
+                urls[size][fmt] = storage.url(name)
+            else:
+                urls[size][fmt] = original_url if fmt == 'jpeg' else None
+    return urls
@@ -0,0 +1,148 @@
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+from django.db.models import Q
+from django.http import Http404
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded for the current ordering"""
+
+def _encode_value(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def _attribute(obj, name):
+    if isinstance(obj, dict):
+        # A .values() row, keyed by the lookup itself
+        return obj[name]
+    for part in name.split('__'):
+        obj = getattr(obj, part)
+    return obj
+
+class CursorPage:
+    """One page of a keyset-paginated queryset"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+class KeysetPaginator:
+    """Paginate a queryset by seeking past the sort key of the last row seen"""
+
+    # Sort keys are the queryset ordering plus the primary key as a tie-breaker;
+    # each must be a non-null field or annotation. No OFFSET and no COUNT(*)
+    # unless a count is asked for.
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        ordering = ordering or queryset.query.order_by or queryset.model._meta.ordering or ['-pk']
+        self.keys = []
+        for field in ordering:
+            if not isinstance(field, str):
+                raise ValueError('Keyset pagination requires field name orderings')
+            descending = field.startswith('-')
+            name = field.lstrip('-+')
+            self.keys.append((queryset.model._meta.pk.name if name == 'pk' else name, descending))
+        pk_name = queryset.model._meta.pk.name
+        if pk_name not in [name for name, _ in self.keys]:
+            self.keys.append((pk_name, self.keys[-1][1]))
+
+    def encode_cursor(self, obj, backwards=False):
+        position = [_encode_value(_attribute(obj, name)) for name, _ in self.keys]
+        payload = json.dumps({'p': position, 'b': int(backwards)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            position = payload['p']
+            backwards = bool(payload['b'])
+        except (binascii.Error, ValueError, KeyError, TypeError):
+            raise InvalidCursor('Invalid cursor')
+        if not isinstance(position, list) or len(position) != len(self.keys):
+            raise InvalidCursor('Cursor does not match the current ordering')
+        return position, backwards
+
+    def _seek(self, position, keys):
+        """Rows strictly after position in the given key order"""
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(keys, position):
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def page(self, cursor=None, with_count=False):
+        position, backwards = self.decode_cursor(cursor) if cursor else (None, False)
+        keys = [(name, descending != backwards) for name, descending in self.keys]
+
+        queryset = self.queryset.order_by(*[
+            f'-{name}' if descending else name for name, descending in keys
+        ])
+        if position is not None:
+            queryset = queryset.filter(self._seek(position, keys))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_next, has_previous = position is not None, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(rows[-1])
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(rows[0], backwards=True)
+
+        count = self.queryset.count() if with_count else None
+        return CursorPage(rows, next_cursor, previous_cursor, count)
+
+def wants_count(params):
+    """Whether the client asked for the (exact, extra-query) total count"""
+    return params.get('count', '').lower() in ('1', 'true', 'yes')
+
+class KeysetPaginationMixin:
+    """ListView mixin paginating with opaque ?cursor= tokens instead of ?page= offsets"""
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.page(
+                self.request.GET.get(self.cursor_kwarg),
+                with_count=wants_count(self.request.GET),
+            )
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
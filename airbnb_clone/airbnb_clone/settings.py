@@ -75,6 +75,18 @@ DATABASES = {
     }
 }
 
+# Full-text listing search uses trigram lookups on PostgreSQL
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    INSTALLED_APPS.append('django.contrib.postgres')
+
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # SQLite has no row locks: take the write lock when a transaction starts,
+    # so concurrent booking checks queue up instead of racing, and wait for it
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE', 'timeout': 20}
+    # A file rather than the shared-cache in-memory default, whose table locks
+    # fail immediately instead of waiting, so concurrency tests see real locking
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
 # Custom User Model
 AUTH_USER_MODEL = 'users.User'
 
@@ -122,10 +134,33 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
 }
 
+# Cache (search results are cached for LISTING_SEARCH_CACHE_TIMEOUT seconds)
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='airbnb-clone'),
+    }
+}
+LISTING_SEARCH_CACHE_TIMEOUT = config('LISTING_SEARCH_CACHE_TIMEOUT', default=300, cast=int)
+# Calendars are versioned per listing, so they can be kept much longer
+LISTING_AVAILABILITY_CACHE_TIMEOUT = config('LISTING_AVAILABILITY_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Worker processes for image renditions; 0 processes images inline
+BACKGROUND_WORKERS = config('BACKGROUND_WORKERS', default=2, cast=int)
+
+# Pending bookings the host hasn't confirmed within this many hours are expired
+PENDING_BOOKING_TTL_HOURS = config('PENDING_BOOKING_TTL_HOURS', default=48, cast=int)
+# Minutes a guest's dates stay reserved after they start checking out
+BOOKING_HOLD_MINUTES = config('BOOKING_HOLD_MINUTES', default=10, cast=int)
+# Default-shaped JSON list pages of listings and reviews skip the serializers
+API_FAST_LIST_RESPONSES = config('API_FAST_LIST_RESPONSES', default=True, cast=bool)
+# Hours a create request's Idempotency-Key is remembered for retries
+IDEMPOTENCY_KEY_TTL_HOURS = config('IDEMPOTENCY_KEY_TTL_HOURS', default=24, cast=int)
+
 # Email Configuration
 EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
 EMAIL_HOST = config('EMAIL_HOST', default='smtp.gmail.com')
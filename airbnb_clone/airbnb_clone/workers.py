@@ -0,0 +1,71 @@
+import atexit
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# CPU-bound work (image encoding) runs in a process pool so it neither holds
+# up the request nor competes for the GIL. Workers are spawned rather than
+# forked, so they never inherit database connections; the functions they run
+# must be importable without Django being set up.
+
+_executor = None
+_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+            atexit.register(_executor.shutdown, wait=False, cancel_futures=True)
+        return _executor
+
+def _reset_executor(broken):
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+
+def _run_callback(callback, future, caller):
+    try:
+        callback(future)
+    except Exception:
+        logger.exception('Background task callback failed')
+    finally:
+        # Callbacks normally run on the pool's own thread; don't leave
+        # connections open there, but never close the submitting request's
+        if threading.get_ident() != caller:
+            connections.close_all()
+
+def submit(fn, *args, callback=None):
+    """Run fn(*args) in the worker pool and callback(future) back in this process"""
+    # With BACKGROUND_WORKERS = 0 both run inline, e.g. for tests and commands
+    if not settings.BACKGROUND_WORKERS:
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        if callback is not None:
+            callback(future)
+        return future
+
+    executor = get_executor()
+    try:
+        future = executor.submit(fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool
+        _reset_executor(executor)
+        future = get_executor().submit(fn, *args)
+    if callback is not None:
+        caller = threading.get_ident()
+        future.add_done_callback(lambda done: _run_callback(callback, done, caller))
+    return future
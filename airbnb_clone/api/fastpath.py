@@ -0,0 +1,146 @@
+import math
+from decimal import Decimal
+import orjson
+from django.utils import timezone
+from airbnb_clone.images import AVATAR_SIZES, rendition_urls
+from listings.models import CARD_FIELDS, RATING_CATEGORIES, Listing, ListingImage
+from reviews.models import RATING_FIELDS, Review
+from users.models import User
+from .serializers import absolute_urls
+
+# The hot list endpoints can skip the serializers: rows are read with
+# .values() into plain dicts, converted field by field the way the DRF field
+# the serializer uses would, and rendered with orjson. The bytes match the
+# serializer's response exactly; FastListParityTests holds them to that.
+
+USER_FIELDS = ('id', 'username', 'email', 'user_type', 'phone_number', 'bio',
+               'profile_picture', 'avatars', 'is_verified', 'created_at', 'updated_at')
+REVIEW_FIELDS = ('id', *RATING_FIELDS, 'comment', 'host_response', 'created_at', 'updated_at',
+                 'booking', 'listing', *[f'reviewer__{name}' for name in USER_FIELDS])
+
+class SlowPath(Exception):
+    """Raised when a row can't be rendered exactly as its serializer would; the view falls back to it"""
+
+def _decimal(model, name):
+    # DecimalField.to_representation: quantized to the column's places, as a string
+    exponent = Decimal(1).scaleb(-model._meta.get_field(name).decimal_places)
+
+    def convert(value):
+        return None if value is None else f'{value.quantize(exponent):f}'
+    return convert
+
+def _float(value):
+    if value is None:
+        return None
+    value = float(value)
+    # orjson and json.dumps only agree on floats Python writes without an exponent
+    if not math.isfinite(value) or value and not 1e-4 <= abs(value) < 1e16:
+        raise SlowPath(value)
+    return value
+
+def _datetime(value):
+    # DateTimeField.to_representation in the current time zone, with Z for UTC
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+def _file_url(storage, name, request):
+    if not name:
+        return None
+    return request.build_absolute_uri(storage.url(name))
+
+LATITUDE = _decimal(Listing, 'latitude')
+LONGITUDE = _decimal(Listing, 'longitude')
+BATHROOMS = _decimal(Listing, 'bathrooms')
+PRICE = _decimal(Listing, 'price_per_night')
+COVER_STORAGE = ListingImage._meta.get_field('image').storage
+PICTURE_STORAGE = User._meta.get_field('profile_picture').storage
+
+def render_json(data):
+    """JSON bytes as DRF's JSONRenderer writes them: compact UTF-8 with U+2028/U+2029 escaped"""
+    return orjson.dumps(data).replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+def values_in_order(queryset, ids):
+    """rows_in_order for a .values() queryset"""
+    rows = {row['id']: row for row in queryset.filter(pk__in=ids)}
+    return [rows[pk] for pk in ids if pk in rows]
+
+def card_values(queryset):
+    """A cards() queryset as dicts of the card columns and every selected annotation"""
+    return queryset.values(*CARD_FIELDS, *queryset.query.annotation_select)
+
+def listing_card(row, request):
+    """One card_values() row as ListingCardSerializer renders it"""
+    cover = None
+    if row['primary_image']:
+        urls = rendition_urls(COVER_STORAGE, row['primary_image'], row['primary_image_renditions'] or {})
+        cover = absolute_urls(urls['card'], request)
+    card = {
+        'id': row['id'],
+        'title': row['title'],
+        'property_type': row['property_type'],
+        'city': row['city'],
+        'state': row['state'],
+        'country': row['country'],
+        'latitude': LATITUDE(row['latitude']),
+        'longitude': LONGITUDE(row['longitude']),
+        'bedrooms': row['bedrooms'],
+        'bathrooms': BATHROOMS(row['bathrooms']),
+        'guests': row['guests'],
+        'price_per_night': PRICE(row['price_per_night']),
+        'average_rating': _float(row['rating_sum'] / row['review_count']) if row['review_count'] else 0,
+        'review_count': row['review_count'],
+        'primary_image': cover,
+    }
+    # Only radius searches annotate a distance; without one the serializer skips the field
+    if 'distance_km' in row:
+        card['distance_km'] = _float(row['distance_km'])
+    return card
+
+def review_values(queryset):
+    """A review queryset as dicts of the review columns and the reviewer's"""
+    return queryset.values(*REVIEW_FIELDS)
+
+def _reviewer(row, request):
+    # UserSerializer for the reviewer__ columns
+    picture = row['reviewer__profile_picture']
+    avatars = None
+    if picture:
+        urls = rendition_urls(PICTURE_STORAGE, picture, row['reviewer__avatars'], AVATAR_SIZES)
+        del urls['original']
+        avatars = absolute_urls(urls, request)
+    return {
+        'id': row['reviewer__id'],
+        'username': row['reviewer__username'],
+        'email': row['reviewer__email'],
+        'user_type': row['reviewer__user_type'],
+        'phone_number': row['reviewer__phone_number'],
+        'bio': row['reviewer__bio'],
+        'profile_picture': _file_url(PICTURE_STORAGE, picture, request),
+        'avatars': avatars,
+        'is_verified': row['reviewer__is_verified'],
+        'created_at': _datetime(row['reviewer__created_at']),
+    }
+
+def review(row, request):
+    """One review_values() row as ReviewSerializer renders it"""
+    data = {
+        'id': row['id'],
+        'reviewer': _reviewer(row, request),
+        # Review.average_rating, summed in the same order
+        'average_rating': _float(sum(row[name] for name in RATING_CATEGORIES) / len(RATING_CATEGORIES)),
+    }
+    for name in RATING_FIELDS:
+        data[name] = row[name]
+    data.update({
+        'comment': row['comment'],
+        'host_response': row['host_response'],
+        'created_at': _datetime(row['created_at']),
+        'updated_at': _datetime(row['updated_at']),
+        'booking': row['booking'],
+        'listing': row['listing'],
+    })
+    return data
@@ -0,0 +1,58 @@
+import django_filters
+from rest_framework import filters
+from listings.geo import parse_bbox, parse_point, parse_radius
+from listings.models import Listing
+from listings.search import search_listings
+
+class ListingFilter(django_filters.FilterSet):
+    """Filter set for the listings endpoint"""
+    check_in = django_filters.DateFilter(method='filter_stay')
+    check_out = django_filters.DateFilter(method='filter_stay')
+    near = django_filters.CharFilter(method='filter_geo')
+    radius_km = django_filters.NumberFilter(method='filter_geo')
+    bbox = django_filters.CharFilter(method='filter_geo')
+    amenities = django_filters.CharFilter(method='filter_amenities')
+    
+    class Meta:
+        model = Listing
+        fields = ['property_type', 'city', 'country', 'bedrooms', 'bathrooms']
+    
+    def filter_stay(self, queryset, name, value):
+        # Both dates are needed, so the stay is applied in filter_queryset
+        return queryset
+    
+    def filter_amenities(self, queryset, name, value):
+        return queryset.with_amenities(value.split(','))
+    
+    def filter_geo(self, queryset, name, value):
+        # Applied after every other filter in filter_queryset
+        return queryset
+    
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        data = self.form.cleaned_data
+        check_in = data.get('check_in')
+        check_out = data.get('check_out')
+        if check_in and check_out and check_in < check_out:
+            queryset = queryset.available_between(check_in, check_out)
+        
+        bbox = parse_bbox(data.get('bbox'))
+        if bbox:
+            queryset = queryset.within_bbox(*bbox)
+        near = parse_point(data.get('near'))
+        if near:
+            queryset = queryset.near(*near, parse_radius(data.get('radius_km')))
+            queryset = queryset.order_by('distance_km')
+        return queryset
+
+class ListingSearchFilter(filters.SearchFilter):
+    """Ranked full-text search over listings using the listing search index"""
+    
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        if not query.strip():
+            return queryset
+        queryset = search_listings(queryset, query)
+        if 'distance_km' in queryset.query.annotations:
+            return queryset
+        return queryset.order_by('-search_rank', '-created_at')
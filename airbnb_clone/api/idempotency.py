@@ -0,0 +1,128 @@
+import hashlib
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Form fields that differ between otherwise identical submissions
+IGNORED_FIELDS = ('csrfmiddlewaretoken', 'idempotency_key')
+# A request still unfinished after this long is taken to have died
+STALE_AFTER = timedelta(minutes=1)
+
+class IdempotencyError(Exception):
+    """Raised when a retry can't be answered: the first request is still running, or the key was reused"""
+    
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def request_fingerprint(request):
+    data = getattr(request, 'data', None)
+    if data is None:
+        data = request.POST
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = {
+        'request': f'{request.method} {request.path}',
+        'data': {name: value for name, value in data.items() if name not in IGNORED_FIELDS},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def _claim(user, scope, key, fingerprint):
+    """A new in-progress record for the key, or the finished one a retry should replay"""
+    for _ in range(3):
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, scope=scope, key=key, fingerprint=fingerprint,
+                    expires_at=now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+                )
+        except IntegrityError:
+            pass
+        record = IdempotencyKey.objects.filter(user=user, scope=scope, key=key).first()
+        if record is None:
+            continue
+        if record.expires_at <= now or (record.status_code is None and record.created_at < now - STALE_AFTER):
+            # Expired, or its request died; the conditional delete lets only one retry take over
+            IdempotencyKey.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+            continue
+        if record.fingerprint != fingerprint:
+            raise IdempotencyError(f'This {HEADER} was already used for a different request.', 422)
+        if record.status_code is None:
+            break
+        return record
+    raise IdempotencyError(f'A request with this {HEADER} is still being processed.', 409)
+
+def _snapshot(response):
+    """What a replay needs of a response, or None if it should not be replayed"""
+    if response.status_code >= 500:
+        return None
+    snapshot = {}
+    if response.has_header('Location'):
+        snapshot['location'] = response['Location']
+    if hasattr(response, 'data'):
+        snapshot['data'] = response.data
+    elif 'location' not in snapshot:
+        # A rendered page (e.g. a form with errors): let the retry run again
+        return None
+    return snapshot
+
+def _replay(record):
+    if 'data' in record.response:
+        response = Response(record.response['data'], status=record.status_code)
+    else:
+        response = HttpResponse(status=record.status_code)
+    if 'location' in record.response:
+        response['Location'] = record.response['location']
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+def run_once(request, scope, key, handler):
+    """Run handler() once per user, scope and key; retries get the first outcome back"""
+    if not key or not request.user.is_authenticated:
+        return handler()
+    if len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError(f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.', 400)
+    
+    record = _claim(request.user, scope, key, request_fingerprint(request))
+    if record.status_code is not None:
+        return _replay(record)
+    
+    try:
+        response = handler()
+    except Exception:
+        record.delete()
+        raise
+    snapshot = _snapshot(response)
+    if snapshot is None:
+        record.delete()
+    else:
+        record.status_code = response.status_code
+        record.response = snapshot
+        record.save(update_fields=['status_code', 'response'])
+    return response
+
+def purge_expired_keys():
+    """Delete expired keys; returns how many were removed"""
+    deleted, _ = IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()
+    return deleted
+
+class IdempotentCreateMixin:
+    """ViewSet mixin answering retried creates that carry the same Idempotency-Key with the original response"""
+    
+    def create(self, request, *args, **kwargs):
+        try:
+            return run_once(
+                request, f'api:{self.basename}:create', request.headers.get(HEADER),
+                lambda: super(IdempotentCreateMixin, self).create(request, *args, **kwargs),
+            )
+        except IdempotencyError as e:
+            return Response({'error': e.message}, status=e.status_code)
@@ -0,0 +1,94 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+from bookings.models import Booking
+from listings.models import Listing, ListingImage
+from reviews.models import RATING_FIELDS, Review
+
+User = get_user_model()
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Benchmarks requests/sec of the listing and review list endpoints with the fast list path on and off'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listings', type=int, default=1000)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=300, help='Requests per endpoint and mode')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        # A private cache, so the benchmark's pages never reach the shared one
+        with override_settings(
+            ALLOWED_HOSTS=['testserver'],
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                'LOCATION': 'benchmark-list-endpoints'}},
+            REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'PAGE_SIZE': options['page_size']},
+        ):
+            try:
+                with transaction.atomic():
+                    self.run(options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def run(self, options):
+        host = User.objects.create(username='bench-host', email='bench-host@example.com',
+                                   profile_picture='')
+        guest = User.objects.create(username='bench-guest', email='bench-guest@example.com',
+                                    profile_picture='profile_pics/bench-guest.jpg')
+        listings = Listing.objects.bulk_create([
+            Listing(host=host, title=f'Bench listing {i}', description='Benchmark',
+                    property_type='apartment', street_address='1 Main Street',
+                    city='Bench City', state='State', country='Country', zip_code='00000',
+                    bedrooms=random.randint(1, 4), bathrooms=Decimal('1.5'), guests=4,
+                    price_per_night=Decimal(random.randint(4000, 40000)) / 100,
+                    rating_sum=9, review_count=2)
+            for i in range(options['listings'])
+        ], batch_size=1000)
+        ListingImage.objects.bulk_create([
+            ListingImage(listing=listing, image=f'listing_images/bench-{listing.pk}.jpg', is_primary=True)
+            for listing in listings
+        ], batch_size=1000)
+        today = timezone.now().date()
+        bookings = Booking.objects.bulk_create([
+            Booking(guest=guest, listing=listing, check_in=today - timedelta(days=30 + 5 * stay),
+                    check_out=today - timedelta(days=28 + 5 * stay), guests=1,
+                    total_price=Decimal('200.00'), status='completed')
+            for listing in listings for stay in range(2)
+        ], batch_size=1000)
+        Review.objects.bulk_create([
+            Review(booking=booking, listing_id=booking.listing_id, reviewer=guest,
+                   comment='A pleasant benchmark stay.', **{name: random.randint(3, 5) for name in RATING_FIELDS})
+            for booking in bookings
+        ], batch_size=1000)
+
+        paths = ['/api/listings/', '/api/listings/?ordering=price_per_night', '/api/reviews/']
+        client = Client()
+        self.stdout.write(f'{"endpoint":<40} {"serializer/s":>12} {"fast/s":>10} {"speedup":>8}')
+        for path in paths:
+            rates = {}
+            bodies = {}
+            for fast in (False, True):
+                with override_settings(API_FAST_LIST_RESPONSES=fast):
+                    # Warm the search cache, as a hot endpoint would be
+                    bodies[fast] = client.get(path).content
+                    started = time.perf_counter()
+                    for _ in range(options['requests']):
+                        client.get(path)
+                    rates[fast] = options['requests'] / (time.perf_counter() - started)
+            self.stdout.write(
+                f'{path:<40} {rates[False]:>12.0f} {rates[True]:>10.0f} {rates[True] / rates[False]:>7.2f}x'
+            )
+            if bodies[True] != bodies[False]:
+                self.stderr.write(f'{path}: the fast path response differs from the serializer response')
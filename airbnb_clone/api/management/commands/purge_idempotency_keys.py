@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.idempotency import purge_expired_keys
+
+class Command(BaseCommand):
+    help = 'Deletes idempotency keys past their expiry'
+
+    def handle(self, *args, **kwargs):
+        deleted = purge_expired_keys()
+        
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys'))
@@ -0,0 +1,57 @@
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from airbnb_clone.pagination import InvalidCursor, KeysetPaginator, wants_count
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination for the API, sharing the keyset paginator used by the HTML views"""
+    cursor_query_param = 'cursor'
+    
+    def get_page_size(self, view):
+        return getattr(view, 'page_size', None) or api_settings.PAGE_SIZE
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = KeysetPaginator(queryset, self.get_page_size(view))
+        try:
+            self.page = paginator.page(
+                request.query_params.get(self.cursor_query_param),
+                with_count=wants_count(request.query_params),
+            )
+        except InvalidCursor as e:
+            raise NotFound(str(e))
+        return list(self.page)
+    
+    def restore_page(self, request, page):
+        """Serve a page computed earlier, e.g. from a cache, instead of querying"""
+        self.request = request
+        self.page = page
+        return list(page)
+    
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+    
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.page.count,
+            'next': self.get_link(self.page.next_cursor),
+            'previous': self.get_link(self.page.previous_cursor),
+            'results': data,
+        })
+    
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'nullable': True},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
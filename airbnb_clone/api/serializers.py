@@ -1,46 +1,215 @@
 from rest_framework import serializers
 from users.models import User
-from listings.models import Listing, ListingImage
+from listings.models import RATING_CATEGORIES, Listing, ListingImage
 from bookings.models import Booking
 from reviews.models import Review
 
-class UserSerializer(serializers.ModelSerializer):
+def absolute_urls(urls, request):
+    """Make a rendition URL dict absolute for API clients"""
+    if urls is None or request is None:
+        return urls
+    return {
+        key: absolute_urls(value, request) if isinstance(value, dict)
+        else value and request.build_absolute_uri(value)
+        for key, value in urls.items()
+    }
+
+def _below(paths, name):
+    """The parts after 'name.' of the dotted paths that start with it"""
+    return {path.split('.', 1)[1] for path in paths if path.startswith(f'{name}.')}
+
+def _param_paths(params, name):
+    if name not in params:
+        return None
+    return {path.strip() for value in params.getlist(name) for path in value.split(',') if path.strip()}
+
+class Shape:
+    """Which fields a response includes and which relations it embeds, as dotted paths"""
+    
+    # fields None keeps every field; expand None embeds every relation, which
+    # is the shape responses have without ?fields= or ?expand=
+    
+    def __init__(self, fields=None, expand=None):
+        self.fields = fields
+        self.expand = expand
+    
+    @classmethod
+    def from_params(cls, params):
+        """Shape asked for by ?fields=a,b.c and ?expand=b; shaping collapses unexpanded relations to ids"""
+        fields, expand = _param_paths(params, 'fields'), _param_paths(params, 'expand')
+        if fields is None and expand is None:
+            return cls()
+        expand = expand or set()
+        # Picking a relation's fields expands it, and every relation above it
+        for path in fields or ():
+            parts = path.split('.')
+            expand.update('.'.join(parts[:end]) for end in range(1, len(parts)))
+        return cls(fields, expand)
+    
+    @property
+    def is_default(self):
+        return self.fields is None and self.expand is None
+    
+    def keeps(self, name):
+        """Whether the top-level field name is in the response"""
+        return self.fields is None or name in {path.split('.', 1)[0] for path in self.fields}
+    
+    def expands(self, name):
+        """Whether the top-level relation name is in the response as an embedded object"""
+        return self.keeps(name) and (self.expand is None or name in self.expand)
+    
+    def below(self, name):
+        """Shape of the object embedded under the relation name"""
+        fields = _below(self.fields, name) if self.fields is not None else None
+        return Shape(fields or None, None if self.expand is None else _below(self.expand, name))
+    
+    def embeds(self, path):
+        """Whether the relation at a dotted path ('listing.host') is embedded"""
+        name, _, rest = path.partition('.')
+        return self.expands(name) and (not rest or self.below(name).embeds(rest))
+    
+    def includes(self, path):
+        """Whether the field at a dotted path ('listing.images') is in the response"""
+        name, _, rest = path.partition('.')
+        if not rest:
+            return self.keeps(name)
+        return self.expands(name) and self.below(name).includes(rest)
+
+class ShapedSerializerMixin:
+    """Serializer taking a Shape: unlisted fields are dropped and unexpanded relations become ids"""
+    
+    # Model columns behind each computed field, for loading a shaped response with only()
+    source_columns = {}
+    
+    def __init__(self, *args, shape=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.shape = shape = shape or Shape()
+        if shape.is_default:
+            return
+        if shape.fields is not None:
+            unknown = {path.split('.', 1)[0] for path in shape.fields} - set(self.fields)
+            if unknown:
+                raise serializers.ValidationError({'fields': [f"Unknown field: {', '.join(sorted(unknown))}"]})
+        for name, field in list(self.fields.items()):
+            nested = getattr(field, 'child', field)
+            many = nested is not field
+            if not shape.keeps(name):
+                del self.fields[name]
+            elif not isinstance(nested, serializers.BaseSerializer):
+                continue
+            elif shape.expands(name):
+                self.fields[name] = type(nested)(many=many, read_only=True, shape=shape.below(name))
+            else:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(many=many, read_only=True)
+    
+    @classmethod
+    def columns(cls, shape):
+        """Model columns a response of this shape reads, or None for all of them"""
+        if shape.fields is None:
+            return None
+        model = cls.Meta.model
+        concrete = {field.name for field in model._meta.concrete_fields}
+        columns = {model._meta.pk.name}
+        for name in concrete:
+            if shape.keeps(name):
+                columns.add(name)
+        for name, sources in cls.source_columns.items():
+            if shape.keeps(name):
+                columns.update(sources)
+        return sorted(columns)
+
+class UserSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     """Serializer for User model"""
+    avatars = serializers.SerializerMethodField()
+    
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'user_type', 'phone_number', 
-                  'bio', 'profile_picture', 'is_verified', 'created_at']
+                  'bio', 'profile_picture', 'avatars', 'is_verified', 'created_at']
         read_only_fields = ['id', 'created_at', 'is_verified']
+    
+    source_columns = {'avatars': ('profile_picture', 'avatars')}
+    
+    def get_avatars(self, obj):
+        if obj.avatar_urls is None:
+            return None
+        urls = dict(obj.avatar_urls)
+        del urls['original']
+        return absolute_urls(urls, self.context.get('request'))
 
-class ListingImageSerializer(serializers.ModelSerializer):
+class ListingImageSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     """Serializer for ListingImage model"""
+    renditions = serializers.SerializerMethodField()
+    
     class Meta:
         model = ListingImage
-        fields = ['id', 'image', 'caption', 'is_primary']
+        fields = ['id', 'image', 'caption', 'is_primary', 'renditions']
+    
+    def get_renditions(self, obj):
+        urls = dict(obj.urls)
+        del urls['original']
+        return absolute_urls(urls, self.context.get('request'))
 
-class ListingSerializer(serializers.ModelSerializer):
+class ListingSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Listing model"""
     host = UserSerializer(read_only=True)
     images = ListingImageSerializer(many=True, read_only=True)
     average_rating = serializers.ReadOnlyField()
+    rating_histogram = serializers.ReadOnlyField()
+    category_averages = serializers.ReadOnlyField()
     
     class Meta:
         model = Listing
         fields = '__all__'
         read_only_fields = ['id', 'host', 'created_at', 'updated_at']
+    
+    source_columns = {
+        'average_rating': ('rating_sum', 'review_count'),
+        'rating_histogram': ('review_count',) + tuple(f'rating_{stars}_count' for stars in range(1, 6)),
+        'category_averages': ('review_count',) + tuple(f'{name}_sum' for name in RATING_CATEGORIES),
+    }
+
+class ListingCardSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
+    """Compact listing representation for search results"""
+    primary_image = serializers.SerializerMethodField()
+    average_rating = serializers.ReadOnlyField()
+    distance_km = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = Listing
+        fields = ['id', 'title', 'property_type', 'city', 'state', 'country',
+                  'latitude', 'longitude', 'bedrooms', 'bathrooms', 'guests',
+                  'price_per_night', 'average_rating', 'review_count',
+                  'primary_image', 'distance_km']
+    
+    def get_primary_image(self, obj):
+        if obj.cover_urls is None:
+            return None
+        return absolute_urls(obj.cover_urls['card'], self.context.get('request'))
 
-class BookingSerializer(serializers.ModelSerializer):
+class BookingSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Booking model"""
     guest = UserSerializer(read_only=True)
     listing = ListingSerializer(read_only=True)
+    listing_id = serializers.PrimaryKeyRelatedField(
+        source='listing', queryset=Listing.objects.filter(is_active=True), write_only=True
+    )
     num_nights = serializers.ReadOnlyField()
     
     class Meta:
         model = Booking
         fields = '__all__'
         read_only_fields = ['id', 'guest', 'total_price', 'created_at', 'updated_at']
+    
+    source_columns = {'num_nights': ('check_in', 'check_out')}
 
-class ReviewSerializer(serializers.ModelSerializer):
+class BookingHoldSerializer(serializers.Serializer):
+    """Serializer for a short hold on a listing's dates"""
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    expires_at = serializers.DateTimeField(read_only=True)
+
+class ReviewSerializer(ShapedSerializerMixin, serializers.ModelSerializer):
     """Serializer for Review model"""
     reviewer = UserSerializer(read_only=True)
     average_rating = serializers.ReadOnlyField()
@@ -48,4 +217,6 @@ class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = '__all__'
-        read_only_fields = ['id', 'reviewer', 'booking', 'listing', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = ['id', 'reviewer', 'booking', 'listing', 'created_at', 'updated_at']
+    
+    source_columns = {'average_rating': RATING_CATEGORIES}
\ No newline at end of file
@@ -1,3 +1,328 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from bookings.models import Booking
+from listings.models import Listing, ListingImage
+from reviews.models import Review
+from users.models import User
+from .models import IdempotencyKey
+from .serializers import ListingCardSerializer, ReviewSerializer
 
-# Create your tests here.
+def make_listing(host):
+    return Listing.objects.create(
+        host=host, title='Cabin', description='A cabin', property_type='cabin',
+        street_address='1 Road', city='Aspen', state='Colorado', country='United States',
+        zip_code='81611', bedrooms=1, bathrooms=Decimal('1.0'), guests=2,
+        price_per_night=Decimal('120.00'),
+    )
+
+def stay(days):
+    check_in = timezone.now().date() + timedelta(days=days)
+    return {'check_in': check_in, 'check_out': check_in + timedelta(days=2)}
+
+class QueryCountTests(TestCase):
+    """Each endpoint loads its whole object graph in a fixed number of queries"""
+
+    def setUp(self):
+        cache.clear()
+        self.host = User.objects.create(
+            username='host', email='host@example.com', user_type='host', profile_picture=''
+        )
+        self.guest = User.objects.create(username='guest', email='guest@example.com', profile_picture='')
+        self.client = APIClient()
+
+    def add_stays(self, count):
+        for _ in range(count):
+            listing = make_listing(self.host)
+            for position in range(2):
+                ListingImage.objects.create(
+                    listing=listing, image=f'listing_images/{listing.pk}-{position}.jpg'
+                )
+            booking = Booking.objects.create(
+                guest=self.guest, listing=listing, guests=1, **stay(5 + 3 * listing.pk)
+            )
+            Review.objects.create(
+                booking=booking, listing=listing, reviewer=self.guest, comment='Lovely',
+                rating=5, cleanliness=5, communication=5, check_in=5, accuracy=5, location=5, value=5,
+            )
+
+    def assert_queries(self, user, expected):
+        """Request each path with one stay and then with ten, expecting the same query count"""
+        self.client.force_authenticate(user)
+        for stays in (1, 9):
+            self.add_stays(stays)
+            listing = Listing.objects.first()
+            booking = Booking.objects.first()
+            review = Review.objects.first()
+            for path, queries in expected.items():
+                path = path.format(listing=listing.pk, booking=booking.pk, review=review.pk)
+                cache.clear()
+                with self.subTest(path=path, stays=Booking.objects.count()):
+                    with self.assertNumQueries(queries):
+                        self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_guest_endpoints(self):
+        self.assert_queries(self.guest, {
+            '/api/users/': 1,
+            '/api/users/me/': 0,
+            '/api/listings/': 1,
+            '/api/listings/{listing}/': 2,
+            '/api/bookings/': 2,
+            '/api/bookings/{booking}/': 2,
+            '/api/reviews/': 1,
+            '/api/reviews/{review}/': 1,
+        })
+
+    def test_host_endpoints(self):
+        self.assert_queries(self.host, {
+            '/api/listings/my_listings/': 2,
+            '/api/listings/facets/': 1,
+            '/api/bookings/': 2,
+            '/api/bookings/{booking}/': 2,
+        })
+
+class ConditionalListTests(TestCase):
+    """List pages answer 304 only while everything in their body is unchanged"""
+
+    def setUp(self):
+        cache.clear()
+        self.host = User.objects.create(
+            username='host', email='host@example.com', user_type='host', profile_picture=''
+        )
+        self.client = APIClient()
+        for _ in range(11):
+            make_listing(self.host)
+
+    def test_total_count_changes_the_etag(self):
+        path = '/api/listings/?count=true&ordering=price_per_night'
+        etag = self.client.get(path)['ETag']
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # The new listing sorts after the first page, which keeps its rows and cursors
+        listing = make_listing(self.host)
+        listing.price_per_night = Decimal('999.00')
+        listing.save()
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 12)
+
+class FastListParityTests(TestCase):
+    """The serializer-free list path renders exactly the bytes the serializers do"""
+
+    def setUp(self):
+        cache.clear()
+        self.host = User.objects.create(
+            username='hôte', email='host@example.com', user_type='host', profile_picture=''
+        )
+        self.guest = User.objects.create(
+            username='guest', email='guest@example.com', phone_number='555 0100',
+            bio='Line\u2028separator, "quotes", tab\t and emoji \U0001F600',
+            profile_picture='profile_pics/guest.jpg',
+            avatars={'source': 'profile_pics/guest.jpg', 'small.webp': 'avatars/guest-small.webp'},
+        )
+        self.client = APIClient()
+        for position in range(12):
+            listing = make_listing(self.host)
+            listing.title = f'Cabin \u2029 n\u00ba{position} <b>&</b>'
+            listing.price_per_night = Decimal('99.5') + position
+            listing.latitude = Decimal('39.191098') + Decimal(position) / 1000
+            listing.longitude = Decimal('-106.817539')
+            listing.save()
+            if position % 3:
+                image = ListingImage.objects.create(listing=listing, image=f'listing_images/{position}.jpg')
+                ListingImage.objects.filter(pk=image.pk).update(
+                    renditions={'source': image.image.name, 'card.webp': f'listing_images/{position}-card.webp'}
+                )
+            booking = Booking.objects.create(guest=self.guest, listing=listing, guests=1, **stay(5 + 3 * position))
+            Review.objects.create(
+                booking=booking, listing=listing, reviewer=self.host if position == 5 else self.guest,
+                comment=f'Lovely \u2028 stay {position}', rating=5, cleanliness=4, communication=5,
+                check_in=position % 5 + 1, accuracy=5, location=3, value=4,
+            )
+
+    def fetch(self, path, fast):
+        """Responses for an uncached and a cached request"""
+        cache.clear()
+        with self.settings(API_FAST_LIST_RESPONSES=fast):
+            return [self.client.get(path) for _ in range(2)]
+
+    def assert_parity(self, path, serializer_class, fast_path=True):
+        slow = self.fetch(path, fast=False)
+        if fast_path:
+            # Any use of the serializer on the fast path fails the request
+            with mock.patch.object(serializer_class, 'to_representation', side_effect=AssertionError):
+                fast = self.fetch(path, fast=True)
+        else:
+            fast = self.fetch(path, fast=True)
+        expected = slow[0]
+        self.assertEqual(expected.status_code, 200)
+        # Cached pages, on either path, match the uncached serializer page
+        for response in (slow[1], *fast):
+            self.assertEqual(response.content, expected.content)
+            for header in ('Content-Type', 'ETag', 'Last-Modified', 'Vary', 'Allow'):
+                self.assertEqual(response.headers.get(header), expected.headers.get(header), header)
+        return expected.json()
+
+    def test_listing_pages(self):
+        page = self.assert_parity('/api/listings/?count=true', ListingCardSerializer)
+        self.assertEqual(page['count'], 12)
+        self.assert_parity(page['next'], ListingCardSerializer)
+        self.assert_parity('/api/listings/?ordering=price_per_night', ListingCardSerializer)
+        self.assert_parity('/api/listings/?location=Aspen', ListingCardSerializer)
+
+    def test_radius_search_adds_distances(self):
+        path = '/api/listings/?near=39.19,-106.8&radius_km=50'
+        page = self.assert_parity(path, ListingCardSerializer)
+        self.assertIn('distance_km', page['results'][0])
+        cached = self.fetch(path, fast=True)[1].json()
+        self.assertTrue(all('distance_km' in card for card in cached['results']))
+        self.assert_parity(page['next'], ListingCardSerializer)
+
+    def test_floats_python_writes_with_an_exponent_take_the_serializer(self):
+        page = self.assert_parity('/api/listings/?near=39.1910981,-106.817539', ListingCardSerializer, fast_path=False)
+        self.assertLess(page['results'][0]['distance_km'], 1e-4)
+
+    def test_review_pages(self):
+        page = self.assert_parity('/api/reviews/', ReviewSerializer)
+        self.assert_parity(page['next'], ReviewSerializer)
+        self.client.force_authenticate(self.guest)
+        self.assert_parity('/api/reviews/', ReviewSerializer)
+
+    def test_shaped_and_browsable_responses_take_the_serializer(self):
+        with mock.patch.object(ReviewSerializer, 'to_representation', side_effect=AssertionError):
+            fast = self.fetch('/api/reviews/', fast=True)[0]
+            with self.assertRaises(AssertionError):
+                self.client.get('/api/reviews/?fields=id,rating')
+            with self.assertRaises(AssertionError):
+                self.client.get('/api/reviews/', HTTP_ACCEPT='text/html')
+        self.assertEqual(
+            self.client.get('/api/reviews/', HTTP_IF_NONE_MATCH=fast['ETag']).status_code, 304
+        )
+
+class IdempotencyKeyTests(TestCase):
+    """Retried create requests carrying an Idempotency-Key"""
+
+    def setUp(self):
+        host = User.objects.create(
+            username='host', email='host@example.com', user_type='host', profile_picture=''
+        )
+        self.guest = User.objects.create(username='guest', email='guest@example.com', profile_picture='')
+        self.listing = make_listing(host)
+        self.client = APIClient()
+        self.client.force_authenticate(self.guest)
+
+    def book(self, key=None, days=10):
+        headers = {'Idempotency-Key': key} if key else {}
+        data = {'listing_id': self.listing.pk, 'guests': 1, **stay(days)}
+        return self.client.post('/api/bookings/', data, format='json', headers=headers)
+
+    def test_retry_replays_the_original_response(self):
+        first = self.book('retry-1')
+        retry = self.book('retry-1')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_key_reused_for_a_different_request_is_refused(self):
+        self.book('reused')
+        response = self.book('reused', days=20)
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_failed_request_can_be_retried(self):
+        other = User.objects.create(username='other', email='other@example.com', profile_picture='')
+        Booking.objects.create(guest=other, listing=self.listing, guests=1, **stay(10))
+
+        self.assertEqual(self.book('after-failure').status_code, 400)
+        Booking.objects.filter(guest=other).delete()
+        self.assertEqual(self.book('after-failure').status_code, 201)
+
+    def test_requests_without_a_key_are_not_deduplicated(self):
+        self.book(days=10)
+        self.book(days=20)
+        self.assertEqual(Booking.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_booking_form_resubmission_redirects_to_the_same_booking(self):
+        self.client.force_login(self.guest)
+        url = reverse('create_booking', args=[self.listing.pk])
+        data = {'guests': 1, 'idempotency_key': 'form-1', **stay(10)}
+
+        first = self.client.post(url, data)
+        resubmitted = self.client.post(url, data)
+
+        self.assertEqual(first.status_code, 302)
+        self.assertEqual(resubmitted.status_code, 302)
+        self.assertEqual(resubmitted['Location'], first['Location'])
+        self.assertEqual(Booking.objects.count(), 1)
+
+class ConcurrentIdempotencyTests(TransactionTestCase):
+    """Duplicate submissions of one request arriving at the same time"""
+    attempts = 8
+
+    def setUp(self):
+        host = User.objects.create(
+            username='host', email='host@example.com', user_type='host', profile_picture=''
+        )
+        self.guest = User.objects.create(username='guest', email='guest@example.com', profile_picture='')
+        self.listing = make_listing(host)
+
+    def submit_in_parallel(self, path, data):
+        barrier = threading.Barrier(self.attempts)
+        responses = []
+
+        def attempt():
+            client = APIClient()
+            client.force_authenticate(self.guest)
+            try:
+                barrier.wait()
+                responses.append(client.post(
+                    path, data, format='json', headers={'Idempotency-Key': 'same-key'}
+                ))
+            except Exception as e:
+                responses.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=attempt) for _ in range(self.attempts)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def assert_executed_once(self, responses):
+        codes = [getattr(response, 'status_code', response) for response in responses]
+        self.assertNotIn(False, [code in (201, 409) for code in codes], codes)
+        self.assertIn(201, codes)
+        bodies = {str(response.json()) for response in responses if response.status_code == 201}
+        self.assertEqual(len(bodies), 1)
+
+    def test_duplicate_bookings_execute_once(self):
+        data = {'listing_id': self.listing.pk, 'guests': 1, **stay(10)}
+        responses = self.submit_in_parallel('/api/bookings/', data)
+
+        self.assert_executed_once(responses)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_duplicate_listings_execute_once(self):
+        data = {
+            'title': 'Loft', 'description': 'A loft', 'property_type': 'apartment',
+            'street_address': '2 Street', 'city': 'Denver', 'state': 'Colorado',
+            'country': 'United States', 'zip_code': '80202', 'bedrooms': 1,
+            'bathrooms': '1.0', 'guests': 2, 'price_per_night': '90.00',
+        }
+        responses = self.submit_in_parallel('/api/listings/', data)
+
+        self.assert_executed_once(responses)
+        self.assertEqual(Listing.objects.filter(title='Loft').count(), 1)
@@ -1,103 +1,419 @@
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from django.conf import settings
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError as DjangoValidationError
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 from users.models import User
+from airbnb_clone.conditional import not_modified, set_validators, validators
+from listings.cache import cache_key, get_or_compute, rows_in_order
+from listings.geo import parse_point
 from listings.models import Listing
-from bookings.models import Booking
+from airbnb_clone.pagination import CursorPage
+from bookings.availability import MAX_LISTINGS, MAX_NIGHTS, cached_busy_bitmaps, format_bitmap
+from bookings.models import Booking, InvalidTransition, TransitionConflict, place_hold
+from bookings.stats import monthly_stats, parse_year
 from reviews.models import Review
+from .fastpath import (
+    SlowPath, card_values, listing_card, render_json, review, review_values, values_in_order
+)
+from .filters import ListingFilter, ListingSearchFilter
+from .idempotency import IdempotentCreateMixin
 from .serializers import (
-    UserSerializer, ListingSerializer, 
-    BookingSerializer, ReviewSerializer
+    Shape, UserSerializer, ListingSerializer, ListingCardSerializer,
+    BookingSerializer, BookingHoldSerializer, ReviewSerializer
 )
 
-class UserViewSet(viewsets.ReadOnlyModelViewSet):
+def api_validation_error(error):
+    """Translate a model ValidationError into the API's 400 response shape"""
+    if hasattr(error, 'error_dict'):
+        errors = error.message_dict
+    else:
+        errors = {NON_FIELD_ERRORS: error.messages}
+    if NON_FIELD_ERRORS in errors:
+        errors[api_settings.NON_FIELD_ERRORS_KEY] = errors.pop(NON_FIELD_ERRORS)
+    return ValidationError(errors)
+
+def only_columns(queryset, serializer_class, shape):
+    """Narrow a queryset to the columns a shaped response reads, and updated_at for its ETag"""
+    columns = serializer_class.columns(shape)
+    return queryset if columns is None else queryset.only('updated_at', *columns)
+
+class ShapedResponseMixin:
+    """ViewSet mixin shaping read responses with ?fields= and ?expand="""
+    
+    @property
+    def shape(self):
+        if not hasattr(self, '_shape'):
+            # Writes validate against the full serializer, so only reads are shaped
+            self._shape = Shape()
+            if self.request.method in SAFE_METHODS:
+                self._shape = Shape.from_params(self.request.query_params)
+        return self._shape
+    
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('shape', self.shape)
+        return super().get_serializer(*args, **kwargs)
+
+class ConditionalGetMixin:
+    """ViewSet mixin answering GETs whose ETag or Last-Modified still matches with 304, before serializing"""
+    
+    # Relations (dotted paths) whose updated_at also stamps a response embedding them
+    stamped_relations = ()
+    
+    def get_stamped_relations(self):
+        return self.stamped_relations
+    
+    def stamps(self, obj):
+        if isinstance(obj, dict):
+            # A fast list row carries its relations' stamps as e.g. reviewer__updated_at
+            return [obj['id'], obj['updated_at']] + [
+                obj[f"{path.replace('.', '__')}__updated_at"]
+                for path in self.get_stamped_relations() if self.shape.embeds(path)
+            ]
+        values = [obj.pk, obj.updated_at]
+        for path in self.get_stamped_relations():
+            if self.shape.embeds(path):
+                related = obj
+                for name in path.split('.'):
+                    related = getattr(related, name)
+                values.append(related.updated_at)
+        return values
+    
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag, last_modified = validators(request.user.pk, *self.stamps(instance))
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        return set_validators(response, etag, last_modified)
+    
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        return self.conditional_list(list(queryset) if page is None else page)
+    
+    def conditional_list(self, rows, render=None):
+        """Respond with rows, or 304 when the page's rows, stamps, cursors and any requested count are unchanged"""
+        page = getattr(self.paginator, 'page', None)
+        # The total count is None unless the client asked for it with ?count=
+        extent = (page.next_cursor, page.previous_cursor, page.count) if page is not None else ()
+        etag, last_modified = validators(
+            self.request.user.pk, len(rows), *extent, *[value for row in rows for value in self.stamps(row)]
+        )
+        response = not_modified(self.request, etag, last_modified)
+        if response is None and render is not None:
+            response = render(rows)
+        elif response is None:
+            data = self.get_serializer(rows, many=True).data
+            response = self.get_paginated_response(data) if page is not None else Response(data)
+        return set_validators(response, etag, last_modified)
+
+class FastListMixin:
+    """ViewSet mixin rendering default-shaped JSON list pages from .values() rows, without the serializer"""
+    # Subclasses define fast_row(row): the serializer's representation of one .values() row
+    
+    def fast_list_allowed(self):
+        # Shaped responses, the browsable API and indented JSON take the serializer
+        request = self.request
+        renderer = request.accepted_renderer
+        return (
+            settings.API_FAST_LIST_RESPONSES and self.shape.is_default
+            and isinstance(renderer, JSONRenderer)
+            and renderer.get_indent(request.accepted_media_type, {}) is None
+        )
+    
+    def render_fast(self, rows):
+        data = [self.fast_row(row) for row in rows]
+        if getattr(self.paginator, 'page', None) is not None:
+            data = self.paginator.get_paginated_response(data).data
+        return HttpResponse(render_json(data), content_type='application/json')
+
+class UserViewSet(ShapedResponseMixin, ConditionalGetMixin, viewsets.ReadOnlyModelViewSet):
     """API endpoint for users"""
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     
+    def get_queryset(self):
+        return only_columns(super().get_queryset(), UserSerializer, self.shape)
+    
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def me(self, request):
         """Get current user profile"""
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
-class ListingViewSet(viewsets.ModelViewSet):
+class ListingViewSet(ShapedResponseMixin, ConditionalGetMixin, FastListMixin, IdempotentCreateMixin,
+                     viewsets.ModelViewSet):
     """API endpoint for listings"""
     queryset = Listing.objects.filter(is_active=True)
+    # Image and rating changes move the listing's own updated_at
+    stamped_relations = ('host',)
     serializer_class = ListingSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['property_type', 'city', 'country', 'bedrooms', 'bathrooms']
-    search_fields = ['title', 'description', 'city', 'country']
+    filter_backends = [DjangoFilterBackend, ListingSearchFilter, filters.OrderingFilter]
+    filterset_class = ListingFilter
     ordering_fields = ['price_per_night', 'created_at']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            return queryset.cards()
+        if self.action in ('hold', 'stats'):
+            return queryset
+        # Relations left out of the response are never queried
+        shape = self.shape
+        if shape.embeds('host'):
+            queryset = queryset.select_related('host')
+        if shape.includes('images'):
+            queryset = queryset.prefetch_related('images')
+        return only_columns(queryset, ListingSerializer, shape)
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ListingCardSerializer
+        return ListingSerializer
+    
+    def get_stamped_relations(self):
+        # Cards embed no host
+        if self.action == 'list':
+            return ()
+        return super().get_stamped_relations()
+    
     def perform_create(self, serializer):
         serializer.save(host=self.request.user)
     
+    def fast_row(self, row):
+        return listing_card(row, self.request)
+    
+    def list(self, request, *args, **kwargs):
+        # Cache the page as ids plus cursors; a hit re-reads only those rows
+        queryset = self.get_queryset()
+        fast = self.fast_list_allowed()
+        computed = {}
+        
+        def compute():
+            rows = self.filter_queryset(queryset)
+            computed['rows'] = rows = self.paginate_queryset(card_values(rows) if fast else rows)
+            page = self.paginator.page
+            return {
+                'ids': [row['id'] for row in rows] if fast else [listing.pk for listing in rows],
+                'next': page.next_cursor,
+                'previous': page.previous_cursor,
+                'count': page.count,
+            }
+        
+        result = get_or_compute(
+            cache_key(
+                f'api:{self.paginator.get_page_size(self)}', request.query_params, ignore=('fields', 'expand')
+            ),
+            compute,
+        )
+        rows = computed.get('rows')
+        # Re-read rows carry the radius search's distances, as the search's own rows do
+        near = parse_point(request.query_params.get('near'))
+        if near:
+            queryset = queryset.with_distances(*near)
+        if fast:
+            if rows is None:
+                rows = self.restore_page(values_in_order(card_values(queryset), result['ids']), result)
+            try:
+                return self.conditional_list(rows, self.render_fast)
+            except SlowPath:
+                # Serialize the same page instead
+                rows = self.restore_page(rows_in_order(queryset, result['ids']), result)
+        elif rows is None:
+            rows = self.restore_page(rows_in_order(queryset, result['ids']), result)
+        return self.conditional_list(rows)
+    
+    def restore_page(self, rows, result):
+        return self.paginator.restore_page(
+            self.request, CursorPage(rows, result['next'], result['previous'], result['count'])
+        )
+    
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """Amenity, property type and price counts for the current filters"""
+        return Response(get_or_compute(
+            cache_key('api-facets', request.query_params, ignore=('cursor', 'count', 'fields', 'expand')),
+            lambda: self.filter_queryset(self.get_queryset()).facet_counts(),
+        ))
+    
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """Free/busy night bitmaps for many listings over a date window"""
+        params = request.query_params
+        try:
+            ids = sorted({
+                int(part) for value in params.getlist('ids') for part in value.split(',') if part.strip()
+            })
+        except ValueError:
+            raise ValidationError({'ids': ['Listing ids must be integers.']})
+        if not ids:
+            raise ValidationError({'ids': ['Pass one or more listing ids.']})
+        if len(ids) > MAX_LISTINGS:
+            raise ValidationError({'ids': [f'At most {MAX_LISTINGS} listings per request.']})
+        
+        try:
+            start = parse_date(params.get('start') or '')
+            end = parse_date(params.get('end') or '')
+        except ValueError:
+            start = end = None
+        if not start or not end or start >= end:
+            raise ValidationError({'end': ['Pass start and end dates (YYYY-MM-DD), end after start.']})
+        nights = (end - start).days
+        if nights > MAX_NIGHTS:
+            raise ValidationError({'end': [f'The window can span at most {MAX_NIGHTS} nights.']})
+        
+        listing_ids = list(self.get_queryset().filter(pk__in=ids).values_list('pk', flat=True))
+        bitmaps = cached_busy_bitmaps(listing_ids, start, end)
+        return Response({
+            'start': start,
+            'end': end,
+            'listings': {
+                listing_id: {
+                    'available': not bitmap,
+                    'nights': format_bitmap(bitmap, nights),
+                }
+                for listing_id, bitmap in sorted(bitmaps.items())
+            },
+        })
+    
+    @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
+    def hold(self, request, pk=None):
+        """Reserve dates for a few minutes while the guest checks out"""
+        listing = self.get_object()
+        if listing.host_id == request.user.pk:
+            return Response(
+                {'error': 'You cannot book your own property.'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        serializer = BookingHoldSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            expires_at = place_hold(listing.pk, request.user, **serializer.validated_data)
+        except DjangoValidationError as e:
+            raise api_validation_error(e)
+        serializer = BookingHoldSerializer({**serializer.validated_data, 'expires_at': expires_at})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def stats(self, request, pk=None):
+        """Monthly nights, occupancy, revenue and average daily rate (host only)"""
+        listing = self.get_object()
+        if listing.host_id != request.user.pk:
+            return Response(
+                {'error': 'Only the host can see listing stats'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        try:
+            year = parse_year(request.query_params.get('year'), timezone.now().year)
+        except ValueError:
+            raise ValidationError({'year': ['Pass a year such as 2026.']})
+        return Response({
+            'listing': listing.pk,
+            'year': year,
+            'months': monthly_stats([listing.pk], year)[listing.pk],
+        })
+    
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def my_listings(self, request):
         """Get current user's listings"""
-        listings = self.queryset.filter(host=request.user)
+        listings = self.get_queryset().filter(host=request.user)
         serializer = self.get_serializer(listings, many=True)
         return Response(serializer.data)
 
-class BookingViewSet(viewsets.ModelViewSet):
+class BookingViewSet(ShapedResponseMixin, ConditionalGetMixin, IdempotentCreateMixin, viewsets.ModelViewSet):
     """API endpoint for bookings"""
     queryset = Booking.objects.all()
+    stamped_relations = ('guest', 'listing', 'listing.host')
     serializer_class = BookingSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
         user = self.request.user
-        return Booking.objects.filter(guest=user) | Booking.objects.filter(listing__host=user)
+        shape = self.shape
+        queryset = Booking.objects.filter(Q(guest=user) | Q(listing__host=user))
+        # By default the serializer nests the guest, and the listing with its
+        # host and images; relations left out of the response are never queried
+        related = [path for path in ('guest', 'listing', 'listing.host') if shape.embeds(path)]
+        if related:
+            queryset = queryset.select_related(*[path.replace('.', '__') for path in related])
+        if shape.includes('listing.images'):
+            queryset = queryset.prefetch_related('listing__images')
+        return only_columns(queryset, BookingSerializer, shape)
     
     def perform_create(self, serializer):
-        serializer.save(guest=self.request.user)
+        try:
+            serializer.save(guest=self.request.user)
+        except DjangoValidationError as e:
+            raise api_validation_error(e)
     
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         """Cancel a booking"""
         booking = self.get_object()
-        if booking.guest != request.user:
+        if booking.guest_id != request.user.pk:
             return Response(
                 {'error': 'You can only cancel your own bookings'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        if booking.status not in ['pending', 'confirmed']:
-            return Response(
-                {'error': 'This booking cannot be cancelled'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        booking.status = 'cancelled'
-        booking.save()
-        return Response({'status': 'booking cancelled'})
+        return self._transition(booking.cancel, 'booking cancelled')
     
     @action(detail=True, methods=['post'])
     def confirm(self, request, pk=None):
         """Confirm a booking (host only)"""
         booking = self.get_object()
-        if booking.listing.host != request.user:
+        if booking.listing.host_id != request.user.pk:
             return Response(
                 {'error': 'Only the host can confirm bookings'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        if booking.status != 'pending':
-            return Response(
-                {'error': 'This booking cannot be confirmed'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        booking.status = 'confirmed'
-        booking.save()
-        return Response({'status': 'booking confirmed'})
+        return self._transition(booking.confirm, 'booking confirmed')
+    
+    def _transition(self, change, done):
+        try:
+            change()
+        except TransitionConflict as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_409_CONFLICT)
+        except InvalidTransition as e:
+            return Response({'error': e.messages[0]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'status': done})
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(ShapedResponseMixin, ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     """API endpoint for reviews"""
     queryset = Review.objects.all()
+    stamped_relations = ('reviewer',)
     serializer_class = ReviewSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.shape.embeds('reviewer'):
+            queryset = queryset.select_related('reviewer')
+        return only_columns(queryset, ReviewSerializer, self.shape)
+    
+    def fast_row(self, row):
+        return review(row, self.request)
+    
+    def list(self, request, *args, **kwargs):
+        if self.fast_list_allowed():
+            try:
+                queryset = review_values(self.filter_queryset(self.get_queryset()))
+                page = self.paginate_queryset(queryset)
+                return self.conditional_list(list(queryset) if page is None else page, self.render_fast)
+            except SlowPath:
+                pass
+        return super().list(request, *args, **kwargs)
+    
     def perform_create(self, serializer):
         serializer.save(reviewer=self.request.user)
\ No newline at end of file
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.cache import cache
+from listings.cache import KEY_PREFIX, listing_availability_versions
+from .models import hold_bitmaps, occupancy_bitmaps
+
+# Limits on one availability request
+MAX_LISTINGS = 500
+MAX_NIGHTS = 366
+
+def format_bitmap(bitmap, length):
+    """A bitmap as one '0' (free) or '1' (busy) character per night"""
+    return ''.join('1' if bitmap >> night & 1 else '0' for night in range(length))
+
+def cached_busy_bitmaps(listing_ids, start, end):
+    """Busy-night bitmaps: booked nights cached per listing until one of its bookings changes, plus live holds"""
+    versions = listing_availability_versions(listing_ids)
+    keys = {
+        listing_id: f'{KEY_PREFIX}:calendar:{listing_id}:{versions[listing_id]}:{start}:{end}'
+        for listing_id in listing_ids
+    }
+    cached = cache.get_many(keys.values())
+    bitmaps = {
+        listing_id: cached[key] for listing_id, key in keys.items() if key in cached
+    }
+    missing = [listing_id for listing_id in listing_ids if listing_id not in bitmaps]
+    if missing:
+        computed = occupancy_bitmaps(missing, start, end)
+        cache.set_many(
+            {keys[listing_id]: bitmap for listing_id, bitmap in computed.items()},
+            settings.LISTING_AVAILABILITY_CACHE_TIMEOUT,
+        )
+        bitmaps.update(computed)
+    # Holds expire without touching the cache versions, so they are never cached
+    holds = hold_bitmaps(listing_ids, start, end)
+    return {listing_id: bitmap | holds[listing_id] for listing_id, bitmap in bitmaps.items()}
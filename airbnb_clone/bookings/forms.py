@@ -1,5 +1,6 @@
 from django import forms
-from .models import Booking
+from django.utils import timezone
+from .models import Booking, period_filters
 
 class BookingForm(forms.ModelForm):
     """Form for creating bookings"""
@@ -18,4 +19,45 @@ class BookingForm(forms.ModelForm):
         self.listing = listing
         
         if listing:
-            self.fields['guests'].widget.attrs['max'] = listing.guests
\ No newline at end of file
+            self.fields['guests'].widget.attrs['max'] = listing.guests
+
+class HostBookingFilterForm(forms.Form):
+    """Filters for the host bookings dashboard"""
+    PERIOD_CHOICES = (
+        ('', 'Any time'),
+        ('upcoming', 'Upcoming'),
+        ('active', 'Active'),
+        ('past', 'Past'),
+    )
+    
+    status = forms.ChoiceField(
+        choices=(('', 'All statuses'),) + Booking.STATUS_CHOICES, required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    period = forms.ChoiceField(
+        choices=PERIOD_CHOICES, required=False,
+        widget=forms.Select(attrs={'class': 'form-select'}),
+    )
+    start = forms.DateField(
+        required=False, label='Staying from',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    end = forms.DateField(
+        required=False, label='Staying until',
+        widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+    )
+    
+    def filter(self, queryset):
+        """Apply the filters that validated to a bookings queryset"""
+        self.is_valid()
+        data = self.cleaned_data
+        if data.get('status'):
+            queryset = queryset.filter(status=data['status'])
+        if data.get('period'):
+            queryset = queryset.filter(period_filters(timezone.now().date())[data['period']])
+        # Stays overlapping the chosen dates
+        if data.get('start'):
+            queryset = queryset.filter(check_out__gt=data['start'])
+        if data.get('end'):
+            queryset = queryset.filter(check_in__lte=data['end'])
+        return queryset
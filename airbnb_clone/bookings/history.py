@@ -0,0 +1,269 @@
+import csv
+import json
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from listings.cache import invalidate_availability
+from listings.models import Listing
+from reviews.models import RATING_FIELDS, Review, rebuild_listing_ratings
+from .models import ACTIVE_STATUSES, BookedNight, Booking, OccupancyCalendar, purge_expired_holds
+from .stats import rebuild_daily_stats
+
+# Imported stays are written with bulk_create, skipping Booking.save and the
+# review hooks. Pending and confirmed stays claim their nights in the batch's
+# own locked transaction, like a live booking; the rating and stats
+# aggregates are rebuilt once at the end. Rows are validated a batch at a
+# time and a rejected row doesn't stop the rest.
+
+# Columns of an import row; review_* columns are optional and need a completed stay
+BOOKING_COLUMNS = ('listing_id', 'guest_email', 'check_in', 'check_out', 'guests',
+                   'total_price', 'status', 'special_requests')
+REVIEW_COLUMNS = tuple(f'review_{name}' for name in RATING_FIELDS) + ('review_comment', 'review_host_response')
+
+STATUSES = {value for value, _ in Booking.STATUS_CHOICES}
+
+class ImportResult:
+    """Outcome of one imported batch"""
+
+    def __init__(self, bookings=0, reviews=0, errors=None, listing_ids=()):
+        self.bookings = bookings
+        self.reviews = reviews
+        self.errors = errors or []
+        self.listing_ids = set(listing_ids)
+
+def read_rows(stream, format):
+    """(line number, dict) for each record of a CSV or NDJSON stream"""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line, text in enumerate(stream, start=1):
+        if text.strip():
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else {'_invalid': 'Not a JSON object.'}
+
+def parse_row(row):
+    """Typed booking and review values from a raw row; raises ValueError with the problem"""
+    if '_invalid' in row:
+        raise ValueError(row['_invalid'])
+
+    def text(name):
+        value = row.get(name)
+        return '' if value is None else str(value).strip()
+
+    def integer(name):
+        try:
+            return int(text(name))
+        except ValueError:
+            raise ValueError(f'{name} must be a whole number.')
+
+    def day(name):
+        try:
+            return date.fromisoformat(text(name))
+        except ValueError:
+            raise ValueError(f'{name} must be a date (YYYY-MM-DD).')
+
+    booking = {
+        'listing_id': integer('listing_id'),
+        'guest_email': text('guest_email'),
+        'check_in': day('check_in'),
+        'check_out': day('check_out'),
+        'guests': integer('guests'),
+        'status': text('status') or 'completed',
+        'special_requests': text('special_requests'),
+        'total_price': None,
+    }
+    if not booking['guest_email']:
+        raise ValueError('guest_email is required.')
+    if booking['status'] not in STATUSES:
+        raise ValueError(f"status must be one of {', '.join(sorted(STATUSES))}.")
+    if text('total_price'):
+        try:
+            booking['total_price'] = Decimal(text('total_price'))
+        except InvalidOperation:
+            raise ValueError('total_price must be a number.')
+
+    review = None
+    if text('review_rating'):
+        if booking['status'] != 'completed':
+            raise ValueError('Only completed stays can carry a review.')
+        review = {name: integer(f'review_{name}') for name in RATING_FIELDS}
+        review['comment'] = text('review_comment')
+        review['host_response'] = text('review_host_response')
+    return booking, review
+
+def overlapping(listing_ids, starts, ends):
+    """Mask of stays overlapping another stay of the same listing, by sort-and-sweep"""
+    listing_ids = np.asarray(listing_ids, dtype=np.int64)
+    starts = np.asarray(starts, dtype='datetime64[D]').astype(np.int64)
+    ends = np.asarray(ends, dtype='datetime64[D]').astype(np.int64)
+    conflict = np.zeros(len(starts), dtype=bool)
+    if len(starts) < 2:
+        return conflict
+
+    order = np.lexsort((ends, starts, listing_ids))
+    listing_ids, starts, ends = listing_ids[order], starts[order], ends[order]
+    same_listing = listing_ids[1:] == listing_ids[:-1]
+    # Latest check-out among the earlier stays of each listing: a running max
+    # of check-outs, offset per listing so one listing's max can't leak into
+    # the next
+    _, group = np.unique(listing_ids, return_inverse=True)
+    base = min(starts.min(), ends.min())
+    span = ends.max() - base + 1
+    running = np.maximum.accumulate(group * span + ends - base)
+    latest_before = running[:-1] - group[1:] * span + base
+    # Sorted by check-in, a stay overlaps a later one exactly when it overlaps
+    # the next, and an earlier one exactly when one checks out after it arrives
+    hits_earlier = same_listing & (latest_before > starts[1:])
+    hits_next = same_listing & (starts[1:] < ends[:-1])
+    conflict[order[1:][hits_earlier]] = True
+    conflict[order[:-1][hits_next]] = True
+    return conflict
+
+def _resolve_guests(emails, create_guests):
+    """User id per email, creating missing guests when asked to"""
+    User = get_user_model()
+    found = dict(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+    missing = sorted(set(emails) - found.keys())
+    if missing and create_guests:
+        users = [User(username=email, email=email, user_type='guest') for email in missing]
+        for user in users:
+            user.set_unusable_password()
+        User.objects.bulk_create(users, ignore_conflicts=True)
+        found.update(User.objects.filter(email__in=missing).values_list('email', 'pk'))
+    return found
+
+def import_batch(rows, create_guests=False):
+    """Validate and insert one batch of (line, row) pairs in a single transaction"""
+    result = ImportResult()
+    parsed = []
+    for line, row in rows:
+        try:
+            parsed.append((line, *parse_row(row)))
+        except ValueError as e:
+            result.errors.append((line, str(e)))
+    if not parsed:
+        return result
+
+    with transaction.atomic():
+        listing_ids = sorted({booking['listing_id'] for _, booking, _ in parsed})
+        # The same lock Booking.save takes, so live bookings can't slip in between
+        listings = {
+            pk: (capacity, price) for pk, capacity, price in Listing.objects.select_for_update()
+            .filter(pk__in=listing_ids).values_list('pk', 'guests', 'price_per_night')
+        }
+        guests = _resolve_guests({booking['guest_email'] for _, booking, _ in parsed}, create_guests)
+
+        # Row checks as array comparisons over the whole batch
+        listing_col = np.array([booking['listing_id'] for _, booking, _ in parsed], dtype=np.int64)
+        check_in = np.array([booking['check_in'] for _, booking, _ in parsed], dtype='datetime64[D]')
+        check_out = np.array([booking['check_out'] for _, booking, _ in parsed], dtype='datetime64[D]')
+        completed = np.array([booking['status'] == 'completed' for _, booking, _ in parsed])
+        party = np.array([booking['guests'] for _, booking, _ in parsed], dtype=np.int64)
+        capacity = np.array([listings.get(pk, (0, 0))[0] for pk in listing_col], dtype=np.int64)
+        scores = np.array([
+            [review[name] for name in RATING_FIELDS] if review else [3] * len(RATING_FIELDS)
+            for _, _, review in parsed
+        ], dtype=np.int64)
+        problems = [
+            (~np.isin(listing_col, list(listings)), 'Listing does not exist.'),
+            (~np.array([booking['guest_email'] in guests for _, booking, _ in parsed]),
+             'No user has this guest_email; pass --create-guests to add them.'),
+            (check_out <= check_in, 'Check-out date must be after check-in date.'),
+            (completed & (check_out > np.datetime64(timezone.now().date())), 'A completed stay must have ended.'),
+            ((party < 1) | (party > capacity), 'guests must be between 1 and the listing capacity.'),
+            (((scores < 1) | (scores > 5)).any(axis=1), 'Review scores must be between 1 and 5.'),
+        ]
+        rejected = np.zeros(len(parsed), dtype=bool)
+        for mask, message in problems:
+            for index in np.flatnonzero(mask & ~rejected):
+                result.errors.append((parsed[index][0], message))
+            rejected |= mask
+
+        # Cancelled stays hold no nights; every other stay must not overlap
+        # another one in this batch, one already stored for the listing or a
+        # guest's live hold (one night each)
+        occupying = ~rejected & np.array([booking['status'] != 'cancelled' for _, booking, _ in parsed])
+        if occupying.any():
+            occupied = np.unique(listing_col[occupying]).tolist()
+            first = check_in[occupying].min().item()
+            last = check_out[occupying].max().item()
+            purge_expired_holds(listing_id__in=occupied)
+            stored = list(
+                Booking.objects.exclude(status='cancelled')
+                .filter(listing_id__in=occupied, check_in__lt=last, check_out__gt=first)
+                .values_list('listing_id', 'check_in', 'check_out')
+            )
+            stored += [
+                (listing_id, night, night + timedelta(days=1))
+                for listing_id, night in BookedNight.objects.filter(
+                    booking=None, listing_id__in=occupied, night__gte=first, night__lt=last
+                ).values_list('listing_id', 'night')
+            ]
+            candidates = np.flatnonzero(occupying)
+            conflict = overlapping(
+                np.concatenate([listing_col[candidates], [row[0] for row in stored]]),
+                np.concatenate([check_in[candidates], np.array([row[1] for row in stored], dtype='datetime64[D]')]),
+                np.concatenate([check_out[candidates], np.array([row[2] for row in stored], dtype='datetime64[D]')]),
+            )[:len(candidates)]
+            for index in candidates[conflict]:
+                result.errors.append((parsed[index][0], 'Overlaps another stay at this listing.'))
+                rejected[index] = True
+
+        accepted = [parsed[index] for index in np.flatnonzero(~rejected)]
+        bookings = []
+        for _, values, _ in accepted:
+            values = dict(values)
+            nights = (values['check_out'] - values['check_in']).days
+            if values['total_price'] is None:
+                values['total_price'] = nights * listings[values['listing_id']][1]
+            values['guest_id'] = guests[values.pop('guest_email')]
+            bookings.append(Booking(**values))
+        Booking.objects.bulk_create(bookings)
+        # Index the active stays' nights before the listing locks are released,
+        # so a live booking sees them as soon as the batch commits
+        active = [booking for booking in bookings if booking.status in ACTIVE_STATUSES]
+        BookedNight.objects.bulk_create([
+            BookedNight(listing_id=booking.listing_id, booking=booking, night=night)
+            for booking in active for night in booking.nights()
+        ])
+        for booking in active:
+            OccupancyCalendar.mark(booking.listing_id, booking.nights(), held=True)
+        reviews = [
+            Review(booking=booking, listing_id=booking.listing_id, reviewer_id=booking.guest_id, **review)
+            for booking, (_, _, review) in zip(bookings, accepted) if review
+        ]
+        Review.objects.bulk_create(reviews)
+
+    for listing_id in sorted({booking.listing_id for booking in active}):
+        invalidate_availability(listing_id)
+    result.errors.sort()
+    result.bookings = len(bookings)
+    result.reviews = len(reviews)
+    result.listing_ids = {booking.listing_id for booking in bookings}
+    return result
+
+def import_history(rows, batch_size=1000, create_guests=False):
+    """Import (line, row) pairs a batch at a time, yielding each batch's ImportResult"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield import_batch(batch, create_guests)
+            batch = []
+    if batch:
+        yield import_batch(batch, create_guests)
+
+def rebuild_imported_aggregates(listing_ids):
+    """Bring the aggregates bulk_create skipped up to date for the imported listings"""
+    listing_ids = sorted(listing_ids)
+    with transaction.atomic():
+        rebuild_listing_ratings(Listing.objects.filter(pk__in=listing_ids))
+    rebuild_daily_stats(listing_ids=listing_ids)
@@ -0,0 +1,48 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from listings.cache import invalidate_availability
+from .models import ACTIVE_STATUSES, EARNING_STATUSES, TRANSITIONS, BookedNight, Booking, release_nights
+
+# Bookings leave a phase's filter as they move, so each phase just takes the
+# first batch still matching until none is left. Nothing needs remembering
+# between runs: an interrupted run resumes where it stopped, and a repeated
+# one finds nothing to do.
+
+def lifecycle_phases(now=None):
+    """(label, source status, target status, filter, index column) per phase"""
+    now = now or timezone.now()
+    today = now.date()
+    pending_ttl = timedelta(hours=settings.PENDING_BOOKING_TTL_HOURS)
+    return [
+        ('Completed finished stays', 'confirmed', 'completed', Q(check_out__lte=today), 'check_out'),
+        ('Expired unconfirmed requests', 'pending', 'cancelled', Q(created_at__lt=now - pending_ttl), 'created_at'),
+        ('Expired requests for past dates', 'pending', 'cancelled', Q(check_in__lt=today), 'check_in'),
+    ]
+
+def advance_bookings(source, target, condition, order, batch_size=1000):
+    """Move matching bookings from source to target status a batch at a time, yielding each batch's size"""
+    assert source in TRANSITIONS[target]
+    assert (source in EARNING_STATUSES) == (target in EARNING_STATUSES)
+    while True:
+        with transaction.atomic():
+            # Rows another transaction holds are left for the next run
+            rows = list(
+                Booking.objects.select_for_update(skip_locked=True)
+                .filter(condition, status=source)
+                .order_by(order, 'pk')
+                .values_list('pk', 'listing_id')[:batch_size]
+            )
+            if not rows:
+                return
+            ids = [pk for pk, _ in rows]
+            Booking.objects.filter(pk__in=ids).update(status=target, updated_at=timezone.now())
+            # confirmed -> completed and pending -> cancelled don't change whether
+            # a booking earns, so the daily stats rollup needs no update
+            if target not in ACTIVE_STATUSES:
+                release_nights(BookedNight.objects.filter(booking_id__in=ids))
+                for listing_id in {listing_id for _, listing_id in rows}:
+                    invalidate_availability(listing_id)
+        yield len(rows)
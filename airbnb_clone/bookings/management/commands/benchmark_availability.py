@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from bookings.models import Booking, BookedNight
+from listings.models import Listing
+
+User = get_user_model()
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Benchmarks date-range availability search as the Booking table grows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000,1000000',
+                            help='Comma-separated Booking table sizes to measure')
+        parser.add_argument('--listings', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        try:
+            with transaction.atomic():
+                self.run(sizes, options['listings'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, sizes, listing_count, repeat):
+        host = User.objects.create(username='bench-host', email='bench-host@example.com',
+                                   profile_picture='')
+        guest = User.objects.create(username='bench-guest', email='bench-guest@example.com',
+                                    profile_picture='')
+        listing_ids = [listing.pk for listing in Listing.objects.bulk_create([
+            Listing(host=host, title=f'Bench listing {i}', description='Benchmark',
+                    property_type='apartment', street_address='1 Main Street',
+                    city='Bench City', state='State', country='Country', zip_code='00000',
+                    bedrooms=1, bathrooms=Decimal('1.0'), guests=2,
+                    price_per_night=Decimal('100.00'))
+            for i in range(listing_count)
+        ], batch_size=1000)]
+        
+        today = timezone.now().date()
+        
+        # Upcoming bookings: a fixed share of the next 90 nights, held through the index
+        upcoming = []
+        for listing_id in listing_ids:
+            start = today + timedelta(days=random.randint(1, 60))
+            upcoming.append(Booking(
+                guest=guest, listing_id=listing_id, check_in=start,
+                check_out=start + timedelta(days=random.randint(2, 10)),
+                guests=1, total_price=Decimal('300.00'), status='confirmed',
+            ))
+        for booking in Booking.objects.bulk_create(upcoming, batch_size=1000):
+            BookedNight.objects.bulk_create(
+                [BookedNight(listing_id=booking.listing_id, booking=booking, night=night)
+                 for night in booking.nights()],
+                ignore_conflicts=True,
+            )
+        
+        self.stdout.write(f'{"bookings":>12} {"median ms":>10} {"p95 ms":>10} {"results":>8}')
+        total = len(upcoming)
+        for size in sizes:
+            # History grows the table without adding held nights
+            history = []
+            while total + len(history) < size:
+                start = today - timedelta(days=random.randint(30, 3650))
+                history.append(Booking(
+                    guest=guest, listing_id=random.choice(listing_ids), check_in=start,
+                    check_out=start + timedelta(days=random.randint(1, 14)),
+                    guests=1, total_price=Decimal('300.00'),
+                    status=random.choice(['completed', 'completed', 'cancelled']),
+                ))
+                if len(history) >= 10000:
+                    Booking.objects.bulk_create(history, batch_size=1000)
+                    total += len(history)
+                    history = []
+            Booking.objects.bulk_create(history, batch_size=1000)
+            total += len(history)
+            
+            timings = []
+            results = 0
+            for _ in range(repeat):
+                check_in = today + timedelta(days=random.randint(1, 60))
+                check_out = check_in + timedelta(days=random.randint(1, 7))
+                started = time.perf_counter()
+                page = list(
+                    Listing.objects.filter(is_active=True)
+                    .available_between(check_in, check_out)
+                    .order_by('-created_at')
+                    .values_list('pk', flat=True)[:20]
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+                results = len(page)
+            timings.sort()
+            p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+            self.stdout.write(
+                f'{total:>12} {statistics.median(timings):>10.2f} {p95:>10.2f} {results:>8}'
+            )
@@ -0,0 +1,32 @@
+import time
+from django.core.management.base import BaseCommand
+from bookings.lifecycle import advance_bookings, lifecycle_phases
+from bookings.models import purge_expired_holds
+
+class Command(BaseCommand):
+    help = 'Completes confirmed bookings whose stay has ended, expires stale pending ones and purges expired holds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--every', type=int, metavar='SECONDS',
+                            help='Keep running, starting a new pass every SECONDS')
+
+    def handle(self, *args, **options):
+        while True:
+            self.run_once(options['batch_size'], options['verbosity'])
+            if not options['every']:
+                return
+            time.sleep(options['every'])
+
+    def run_once(self, batch_size, verbosity):
+        self.stdout.write(f'Purged expired holds: {purge_expired_holds()} nights')
+        for label, source, target, condition, order in lifecycle_phases():
+            started = time.perf_counter()
+            moved = 0
+            for batch in advance_bookings(source, target, condition, order, batch_size):
+                moved += batch
+                if verbosity > 1:
+                    self.stdout.write(f'  {label}: {moved} so far')
+            elapsed = time.perf_counter() - started
+            rate = moved / elapsed if elapsed else 0
+            self.stdout.write(f'{label}: {moved} bookings in {elapsed:.2f}s ({rate:.0f}/s)')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+from bookings.models import rebuild_booked_nights
+
+class Command(BaseCommand):
+    help = 'Rebuilds the nightly availability index from pending and confirmed bookings, keeping live holds'
+
+    def handle(self, *args, **kwargs):
+        nights, conflicts = rebuild_booked_nights()
+        for listing_id, booking_id, night in conflicts:
+            self.stdout.write(f'Listing {listing_id}, {night}: booking {booking_id} overlaps another stay or hold')
+        
+        self.stdout.write(self.style.SUCCESS(f'Indexed {nights} booked nights'))
+        if conflicts:
+            raise CommandError(f'Found {len(conflicts)} double-booked nights; cancel or move the bookings listed above')
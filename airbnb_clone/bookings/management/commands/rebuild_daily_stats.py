@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from bookings.stats import rebuild_daily_stats
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-listing daily earnings and occupancy rollup from confirmed and completed bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Listings rebuilt per transaction')
+
+    def handle(self, *args, **options):
+        rows = rebuild_daily_stats(batch_size=options['batch_size'])
+        
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} listing-day rows'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from bookings.models import check_occupancy
+
+class Command(BaseCommand):
+    help = 'Checks the occupancy calendars against pending and confirmed bookings, repairing drift with --repair'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Rewrite calendars that disagree with the bookings')
+
+    def handle(self, *args, **options):
+        drifted = check_occupancy(repair=options['repair'])
+        for listing_id, year in drifted:
+            self.stdout.write(f'Listing {listing_id}, {year}: calendar disagrees with bookings')
+        
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('Occupancy calendars match the bookings'))
+        elif options['repair']:
+            self.stdout.write(self.style.SUCCESS(f'Repaired {len(drifted)} calendars'))
+        else:
+            raise CommandError(f'{len(drifted)} calendars have drifted; run with --repair to rewrite them')
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:40
+
+import django.db.models.deletion
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def backfill_booked_nights(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    BookedNight = apps.get_model('bookings', 'BookedNight')
+    nights = []
+    for booking in Booking.objects.filter(status__in=['pending', 'confirmed']).iterator():
+        for offset in range((booking.check_out - booking.check_in).days):
+            nights.append(BookedNight(
+                listing_id=booking.listing_id,
+                booking_id=booking.pk,
+                night=booking.check_in + timedelta(days=offset),
+            ))
+    BookedNight.objects.bulk_create(nights, batch_size=2000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0002_initial'),
+        ('listings', '0003_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookedNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booked_nights', to='bookings.booking')),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='booked_nights', to='listings.listing')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['night', 'listing'], name='booked_night_search_idx')],
+                'constraints': [models.UniqueConstraint(fields=('listing', 'night'), name='unique_booked_night')],
+            },
+        ),
+        migrations.RunPython(backfill_booked_nights, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0003_booked_nights'),
+        ('listings', '0007_listingimage_renditions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['listing', 'status', 'check_in', 'check_out'], name='booking_overlap_idx'),
+        ),
+    ]
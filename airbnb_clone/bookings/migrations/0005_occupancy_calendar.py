@@ -0,0 +1,45 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:03
+
+import django.db.models.deletion
+from collections import defaultdict
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def backfill_occupancy(apps, schema_editor):
+    Booking = apps.get_model('bookings', 'Booking')
+    OccupancyCalendar = apps.get_model('bookings', 'OccupancyCalendar')
+    masks = defaultdict(int)
+    for booking in Booking.objects.filter(status__in=['pending', 'confirmed']).iterator():
+        for offset in range((booking.check_out - booking.check_in).days):
+            night = booking.check_in + timedelta(days=offset)
+            masks[booking.listing_id, night.year] |= 1 << (night.timetuple().tm_yday - 1)
+    OccupancyCalendar.objects.bulk_create(
+        [OccupancyCalendar(listing_id=listing_id, year=year, nights=mask.to_bytes(46, 'little'))
+         for (listing_id, year), mask in masks.items()],
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0004_booking_overlap_idx'),
+        ('listings', '0007_listingimage_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancyCalendar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('nights', models.BinaryField(default=b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00', max_length=46)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='listings.listing')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('listing', 'year'), name='unique_occupancy_year')],
+            },
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:07
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0006_booking_lifecycle_idx'),
+        ('listings', '0007_listingimage_renditions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookednight',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='bookednight',
+            name='held_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='held_nights', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='bookednight',
+            name='booking',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='booked_nights', to='bookings.booking'),
+        ),
+        migrations.AddIndex(
+            model_name='bookednight',
+            index=models.Index(fields=['expires_at'], name='booked_night_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.1.6 on 2026-10-18 14:12
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from bookings.stats import split_stays
+
+
+def backfill_daily_stats(apps, schema_editor):
+    # rebuild_daily_stats against the historical models, a batch of listings at a time
+    Listing = apps.get_model('listings', 'Listing')
+    Booking = apps.get_model('bookings', 'Booking')
+    ListingDailyStats = apps.get_model('bookings', 'ListingDailyStats')
+    listing_ids = list(Listing.objects.order_by('pk').values_list('pk', flat=True))
+    for index in range(0, len(listing_ids), 500):
+        stays = list(
+            Booking.objects.filter(listing_id__in=listing_ids[index:index + 500],
+                                   status__in=['confirmed', 'completed'])
+            .values_list('listing_id', 'check_in', 'check_out', 'total_price')
+        )
+        columns = list(zip(*stays)) or [[], [], [], []]
+        cents = [int(round(price * 100)) for price in columns[3]]
+        ids, days, nights, totals = split_stays(columns[0], columns[1], columns[2], cents)
+        ListingDailyStats.objects.bulk_create(
+            [ListingDailyStats(listing_id=int(listing_id), day=day.item(), nights=int(count),
+                               revenue=Decimal(int(total)) / 100)
+             for listing_id, day, count, total in zip(ids, days, nights, totals)],
+            batch_size=2000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bookings', '0007_booking_holds'),
+        ('listings', '0007_listingimage_renditions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('nights', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='listings.listing')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('listing', 'day'), name='unique_listing_day')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
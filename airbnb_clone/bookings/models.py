@@ -1,9 +1,48 @@
-from django.db import models
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
+from listings.cache import invalidate_availability
 from listings.models import Listing
 
+# Statuses that hold the listing's nights
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+UNAVAILABLE_MESSAGE = 'This property is not available for the selected dates.'
+
+# Statuses whose nights count as earned in the daily stats rollup
+EARNING_STATUSES = ('confirmed', 'completed')
+
+# Bytes in one year of an OccupancyCalendar; 368 bits cover a leap year
+CALENDAR_BYTES = 46
+
+# Status changes made through Booking.confirm(), cancel() and complete():
+# target status -> statuses it may be reached from
+TRANSITIONS = {
+    'confirmed': ('pending',),
+    'cancelled': ('pending', 'confirmed'),
+    'completed': ('confirmed',),
+}
+
+def period_filters(today):
+    """Filters for upcoming, active and past stays as of today, ignoring cancellations"""
+    stays = ~Q(status='cancelled')
+    return {
+        'upcoming': stays & Q(check_in__gt=today),
+        'active': stays & Q(check_in__lte=today, check_out__gte=today),
+        'past': stays & Q(check_out__lt=today),
+    }
+
+class InvalidTransition(ValidationError):
+    """Raised when a booking's status does not allow the requested change"""
+
+class TransitionConflict(InvalidTransition):
+    """Raised when another request changed the booking's status first"""
+
 class Booking(models.Model):
     """Model for property bookings"""
     STATUS_CHOICES = (
@@ -39,22 +78,28 @@ class Booking(models.Model):
             if self.check_in < timezone.now().date():
                 errors['check_in'] = 'Check-in date cannot be in the past.'
         
-        # Check if listing exists before validating overlaps
-        if hasattr(self, 'listing') and self.listing:
-            # Check for overlapping bookings
-            overlapping = Booking.objects.filter(
-                listing=self.listing,
-                status__in=['pending', 'confirmed']
-            ).exclude(pk=self.pk)
+        # Check the listing's occupancy calendar and other guests' live holds
+        # for nights already held, unless save() is converting this guest's hold on them
+        if getattr(self, '_from_hold', False):
+            pass
+        elif self.listing_id and self.check_in and self.check_out and self.check_in < self.check_out:
+            held = occupancy_bitmaps([self.listing_id], self.check_in, self.check_out)[self.listing_id]
+            held |= hold_bitmaps(
+                [self.listing_id], self.check_in, self.check_out, exclude_guest=self.guest_id
+            )[self.listing_id]
+            if held and self.pk:
+                # Nights this booking already holds don't count against it
+                stored = Booking.objects.filter(
+                    pk=self.pk, status__in=ACTIVE_STATUSES
+                ).values_list('check_in', 'check_out').first()
+                if stored:
+                    length = self.num_nights
+                    first = min(max((stored[0] - self.check_in).days, 0), length)
+                    last = min(max((stored[1] - self.check_in).days, 0), length)
+                    held &= ~_span(first, last)
             
-            if self.check_in and self.check_out:
-                overlapping = overlapping.filter(
-                    check_in__lt=self.check_out,
-                    check_out__gt=self.check_in
-                )
-                
-                if overlapping.exists():
-                    errors['__all__'] = 'This property is not available for the selected dates.'
+            if held:
+                errors['__all__'] = UNAVAILABLE_MESSAGE
         
         if errors:
             raise ValidationError(errors)
@@ -66,10 +111,126 @@ class Booking(models.Model):
                 num_nights = (self.check_out - self.check_in).days
                 self.total_price = num_nights * self.listing.price_per_night
         
-        # Run validation
-        self.full_clean()
-        
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            hold = self._locked_hold()
+            if hold is None and self.listing_id:
+                # Serialize bookings per listing so the overlap check below
+                # cannot race another request (a no-op on SQLite, whose
+                # IMMEDIATE transactions already serialize writers). A held
+                # stay needs neither: its nights are already this guest's.
+                Listing.objects.select_for_update().filter(pk=self.listing_id).values('pk').first()
+            self._from_hold = hold is not None
+            previous = None
+            if self.pk:
+                # Locked, so a concurrent save of this booking can't also
+                # subtract the same stored stay from the daily stats
+                previous = Booking.objects.select_for_update().filter(pk=self.pk).values(*STAY_FIELDS).first()
+            
+            # Run validation
+            self.full_clean()
+            
+            super().save(*args, **kwargs)
+            if hold is None:
+                self._release_overlapping_hold()
+                self.sync_booked_nights()
+            else:
+                BookedNight.objects.filter(pk__in=hold).update(booking=self, held_by=None, expires_at=None)
+                # Held nights outside a shorter stay go back on sale
+                BookedNight.objects.filter(
+                    listing_id=self.listing_id, held_by_id=self.guest_id, booking=None
+                ).delete()
+                OccupancyCalendar.mark(self.listing_id, self.nights(), held=True)
+            
+            current = self.stay()
+            if previous != current:
+                if previous and previous['status'] in EARNING_STATUSES:
+                    record_stay(previous, -1)
+                if self.status in EARNING_STATUSES:
+                    record_stay(current, 1)
+    
+    def _locked_hold(self):
+        """Ids of the guest's unexpired held nights covering this whole stay, locked, or None"""
+        if self.pk or self.status not in ACTIVE_STATUSES or self.num_nights <= 0:
+            return None
+        if not (self.listing_id and self.guest_id):
+            return None
+        held = list(
+            BookedNight.objects.select_for_update().filter(
+                listing_id=self.listing_id,
+                held_by_id=self.guest_id,
+                booking=None,
+                night__gte=self.check_in,
+                night__lt=self.check_out,
+                expires_at__gt=timezone.now(),
+            ).values_list('pk', flat=True)
+        )
+        return held if len(held) == self.num_nights else None
+    
+    def _release_overlapping_hold(self):
+        # clean() let the guest's own hold through; when the stay differs from
+        # the held one, the booking supersedes the hold rather than converting it
+        if self.status not in ACTIVE_STATUSES or self.num_nights <= 0:
+            return
+        own = BookedNight.objects.filter(listing_id=self.listing_id, held_by_id=self.guest_id, booking=None)
+        if own.filter(night__gte=self.check_in, night__lt=self.check_out).exists():
+            own.delete()
+    
+    def confirm(self):
+        """Mark a pending booking confirmed"""
+        self._transition('confirmed')
+    
+    def cancel(self):
+        """Cancel a pending or confirmed booking, releasing its nights"""
+        self._transition('cancelled')
+    
+    def complete(self):
+        """Mark a confirmed booking completed, releasing its nights"""
+        self._transition('completed')
+    
+    def _transition(self, target):
+        # Only the transition is validated: the dates and overlaps were checked
+        # when the booking was saved, and changing status cannot create overlaps
+        if self.status not in TRANSITIONS[target]:
+            raise InvalidTransition(
+                f'A {self.get_status_display().lower()} booking cannot be {target}.'
+            )
+        with transaction.atomic():
+            updated = Booking.objects.filter(pk=self.pk, status=self.status).update(
+                status=target, updated_at=timezone.now()
+            )
+            if not updated:
+                raise TransitionConflict(
+                    'This booking was changed by someone else. Please reload it and try again.'
+                )
+            if target not in ACTIVE_STATUSES:
+                release_nights(BookedNight.objects.filter(booking_id=self.pk))
+                invalidate_availability(self.listing_id)
+            earning = (self.status in EARNING_STATUSES, target in EARNING_STATUSES)
+            if earning == (False, True):
+                record_stay(self.stay(), 1)
+            elif earning == (True, False):
+                record_stay(self.stay(), -1)
+        self.status = target
+    
+    def stay(self):
+        """The fields the daily stats rollup is computed from"""
+        return {field: getattr(self, field) for field in STAY_FIELDS}
+    
+    def nights(self):
+        """Dates of every night covered by the stay"""
+        return [self.check_in + timedelta(days=offset) for offset in range(self.num_nights)]
+    
+    def sync_booked_nights(self):
+        """Rewrite this booking's rows in the BookedNight index and occupancy calendar"""
+        release_nights(BookedNight.objects.filter(booking=self))
+        if self.status in ACTIVE_STATUSES:
+            # The unique (listing, night) constraint is the last line of
+            # defence against a double booking that slipped past clean()
+            claim_nights([
+                BookedNight(listing_id=self.listing_id, booking=self, night=night)
+                for night in self.nights()
+            ])
+            OccupancyCalendar.mark(self.listing_id, self.nights(), held=True)
     
     @property
     def num_nights(self):
@@ -87,4 +248,293 @@ class Booking(models.Model):
         return self.check_in <= today <= self.check_out
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['listing', 'status', 'check_in', 'check_out'], name='booking_overlap_idx'),
+            # Batches of bookings due to complete or expire, see lifecycle.py
+            models.Index(fields=['status', 'check_out'], name='booking_status_checkout_idx'),
+            models.Index(fields=['status', 'check_in'], name='booking_status_checkin_idx'),
+            models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+        ]
+
+class BookedNight(models.Model):
+    """One row per night held by a pending or confirmed booking, or by a guest's short hold"""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='booked_nights')
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='booked_nights',
+                                null=True, blank=True)
+    night = models.DateField()
+    # Set only on holds, which have no booking yet
+    held_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+                                related_name='held_nights', null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        if self.booking_id is None:
+            return f"{self.listing_id} held on {self.night} until {self.expires_at}"
+        return f"{self.listing_id} booked on {self.night}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'night'], name='unique_booked_night'),
+        ]
+        indexes = [
+            models.Index(fields=['night', 'listing'], name='booked_night_search_idx'),
+            models.Index(fields=['expires_at'], name='booked_night_expiry_idx'),
+        ]
+
+def live_nights(now=None):
+    """Filter for BookedNight rows still in force: booked, or held and unexpired"""
+    return Q(expires_at__isnull=True) | Q(expires_at__gt=now or timezone.now())
+
+def purge_expired_holds(**filters):
+    """Delete holds past their expiry; returns how many nights were freed"""
+    deleted, _ = BookedNight.objects.filter(
+        booking=None, expires_at__lte=timezone.now(), **filters
+    ).delete()
+    return deleted
+
+def claim_nights(rows):
+    """Insert BookedNight rows, raising ValidationError if any night is held or booked"""
+    try:
+        with transaction.atomic():
+            return BookedNight.objects.bulk_create(rows)
+    except IntegrityError:
+        pass
+    # Expired holds keep their rows until purged; clear any in the way and retry once
+    if not purge_expired_holds(listing_id=rows[0].listing_id, night__in=[row.night for row in rows]):
+        raise ValidationError(UNAVAILABLE_MESSAGE)
+    try:
+        with transaction.atomic():
+            return BookedNight.objects.bulk_create(rows)
+    except IntegrityError:
+        raise ValidationError(UNAVAILABLE_MESSAGE)
+
+def place_hold(listing_id, guest, check_in, check_out):
+    """Reserve a stay's nights for guest for BOOKING_HOLD_MINUTES; returns the expiry time"""
+    if check_in >= check_out:
+        raise ValidationError({'check_out': 'Check-out date must be after check-in date.'})
+    if check_in < timezone.now().date():
+        raise ValidationError({'check_in': 'Check-in date cannot be in the past.'})
+    expires_at = timezone.now() + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+    with transaction.atomic():
+        # A guest holds one stay per listing at a time
+        BookedNight.objects.filter(listing_id=listing_id, held_by=guest, booking=None).delete()
+        claim_nights([
+            BookedNight(listing_id=listing_id, held_by=guest, night=check_in + timedelta(days=offset),
+                        expires_at=expires_at)
+            for offset in range((check_out - check_in).days)
+        ])
+    invalidate_availability(listing_id)
+    return expires_at
+
+# Booking fields the daily stats rollup is computed from
+STAY_FIELDS = ('listing_id', 'check_in', 'check_out', 'total_price', 'status')
+
+class ListingDailyStats(models.Model):
+    """Nights booked and revenue earned by a listing on one day, from confirmed and completed bookings"""
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    nights = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    
+    def __str__(self):
+        return f"{self.listing_id} on {self.day}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'day'], name='unique_listing_day'),
+        ]
+
+def nightly_cents(total_price, nights):
+    """A stay's price in cents per night, and for its first night, which takes the rounding remainder"""
+    cents = int(round(Decimal(total_price) * 100))
+    base = cents // nights
+    return base, cents - base * (nights - 1)
+
+def record_stay(stay, sign):
+    """Add (sign 1) or remove (sign -1) a stay's nights and revenue in the daily stats"""
+    nights = (stay['check_out'] - stay['check_in']).days
+    if nights <= 0:
+        return
+    days = [stay['check_in'] + timedelta(days=offset) for offset in range(nights)]
+    base, first = nightly_cents(stay['total_price'], nights)
+    with transaction.atomic():
+        ListingDailyStats.objects.bulk_create(
+            [ListingDailyStats(listing_id=stay['listing_id'], day=day) for day in days],
+            ignore_conflicts=True,
+        )
+        rows = ListingDailyStats.objects.filter(listing_id=stay['listing_id'])
+        # F() updates, so concurrent changes to the same days add up
+        rows.filter(day=days[0]).update(
+            nights=F('nights') + sign, revenue=F('revenue') + Decimal(sign * first) / 100
+        )
+        if nights > 1:
+            rows.filter(day__in=days[1:]).update(
+                nights=F('nights') + sign, revenue=F('revenue') + Decimal(sign * base) / 100
+            )
+
+def _span(first, last):
+    """Bits first..last-1 set"""
+    return ((1 << (last - first)) - 1) << first
+
+def _year_masks(nights):
+    """Calendar bits per year for a collection of nights"""
+    masks = defaultdict(int)
+    for night in nights:
+        masks[night.year] |= 1 << (night.timetuple().tm_yday - 1)
+    return masks
+
+class OccupancyCalendar(models.Model):
+    """Packed bitset of the nights a listing has held in one calendar year"""
+    # Bit n (little-endian) is set when day n + 1 of the year is held by a
+    # pending or confirmed booking
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='occupancy')
+    year = models.PositiveSmallIntegerField()
+    nights = models.BinaryField(max_length=CALENDAR_BYTES, default=bytes(CALENDAR_BYTES))
+    
+    def __str__(self):
+        return f"{self.listing_id} occupancy in {self.year}"
+    
+    @property
+    def bits(self):
+        return int.from_bytes(self.nights, 'little')
+    
+    @bits.setter
+    def bits(self, value):
+        self.nights = value.to_bytes(CALENDAR_BYTES, 'little')
+    
+    @classmethod
+    def mark(cls, listing_id, nights, held):
+        """Set (held) or clear the bits for nights in a listing's calendars"""
+        masks = _year_masks(nights)
+        if not masks:
+            return
+        with transaction.atomic():
+            calendars = {
+                calendar.year: calendar
+                for calendar in cls.objects.select_for_update().filter(listing_id=listing_id, year__in=masks)
+            }
+            for year, mask in masks.items():
+                calendar = calendars.get(year)
+                if calendar is None:
+                    if not held:
+                        continue
+                    calendar = cls(listing_id=listing_id, year=year)
+                calendar.bits = calendar.bits | mask if held else calendar.bits & ~mask
+                calendar.save()
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'year'], name='unique_occupancy_year'),
+        ]
+
+def release_nights(booked_nights):
+    """Delete BookedNight rows and clear their nights from the occupancy calendars"""
+    by_listing = defaultdict(list)
+    for listing_id, night in booked_nights.values_list('listing_id', 'night'):
+        by_listing[listing_id].append(night)
+    booked_nights.delete()
+    for listing_id, nights in by_listing.items():
+        OccupancyCalendar.mark(listing_id, nights, held=False)
+
+def occupancy_bitmaps(listing_ids, start, end):
+    """Held-night bitmaps over [start, end) for many listings, from their calendars"""
+    # Bit i is set when night start + i is held
+    length = (end - start).days
+    bitmaps = dict.fromkeys(listing_ids, 0)
+    calendars = OccupancyCalendar.objects.filter(
+        listing_id__in=listing_ids,
+        year__gte=start.year,
+        year__lte=(end - timedelta(days=1)).year,
+    ).values_list('listing_id', 'year', 'nights')
+    for listing_id, year, nights in calendars:
+        offset = (date(year, 1, 1) - start).days
+        bits = int.from_bytes(nights, 'little')
+        bitmaps[listing_id] |= bits << offset if offset >= 0 else bits >> -offset
+    window = _span(0, length)
+    return {listing_id: bitmap & window for listing_id, bitmap in bitmaps.items()}
+
+def hold_bitmaps(listing_ids, start, end, exclude_guest=None):
+    """Bitmaps over [start, end) of the nights under live holds, which the calendars leave out"""
+    # Holds lapse on their own, so they are read from BookedNight rather than
+    # marked in the calendars, where nothing would clear them
+    bitmaps = dict.fromkeys(listing_ids, 0)
+    holds = BookedNight.objects.filter(
+        listing_id__in=listing_ids, booking=None, night__gte=start, night__lt=end,
+        expires_at__gt=timezone.now(),
+    )
+    if exclude_guest is not None:
+        holds = holds.exclude(held_by_id=exclude_guest)
+    for listing_id, night in holds.values_list('listing_id', 'night'):
+        bitmaps[listing_id] |= 1 << (night - start).days
+    return bitmaps
+
+def check_occupancy(repair=False, batch_size=500):
+    """(listing_id, year) calendars that disagree with the bookings; repair rewrites them"""
+    drifted = []
+    listing_ids = list(Listing.objects.order_by('pk').values_list('pk', flat=True))
+    for index in range(0, len(listing_ids), batch_size):
+        batch = listing_ids[index:index + batch_size]
+        with transaction.atomic():
+            if repair:
+                # The same lock Booking.save takes, so no booking lands mid-repair
+                list(Listing.objects.select_for_update().filter(pk__in=batch).values_list('pk'))
+            expected = defaultdict(int)
+            bookings = Booking.objects.filter(
+                listing_id__in=batch, status__in=ACTIVE_STATUSES
+            ).values_list('listing_id', 'check_in', 'check_out')
+            for listing_id, check_in, check_out in bookings:
+                nights = (check_in + timedelta(days=offset) for offset in range((check_out - check_in).days))
+                for year, mask in _year_masks(nights).items():
+                    expected[listing_id, year] |= mask
+            stored = {
+                (calendar.listing_id, calendar.year): calendar
+                for calendar in OccupancyCalendar.objects.filter(listing_id__in=batch)
+            }
+            for key in sorted(expected.keys() | stored.keys()):
+                calendar = stored.get(key)
+                if expected.get(key, 0) == (calendar.bits if calendar else 0):
+                    continue
+                drifted.append(key)
+                if repair:
+                    calendar = calendar or OccupancyCalendar(listing_id=key[0], year=key[1])
+                    calendar.bits = expected.get(key, 0)
+                    calendar.save()
+    return drifted
+
+def rebuild_booked_nights(batch_size=2000):
+    """Regenerate the BookedNight index from pending and confirmed bookings, keeping live holds"""
+    # Returns (nights indexed, conflicts): a conflict is a (listing_id,
+    # booking_id, night) whose night another stay or a live hold already has.
+    # Its other nights are still indexed.
+    conflicts = []
+    indexed = 0
+    with transaction.atomic():
+        # The same lock Booking.save takes, so no booking claims nights mid-rebuild
+        list(Listing.objects.select_for_update().values_list('pk'))
+        BookedNight.objects.exclude(booking=None, expires_at__gt=timezone.now()).delete()
+        held = defaultdict(set)
+        for listing_id, night in BookedNight.objects.values_list('listing_id', 'night'):
+            held[listing_id].add(night)
+        bookings = Booking.objects.filter(status__in=ACTIVE_STATUSES).only(
+            'pk', 'listing_id', 'check_in', 'check_out'
+        ).order_by('listing_id', 'check_in', 'pk')
+        taken, current = set(), None
+        batch = []
+        for booking in bookings.iterator(chunk_size=batch_size):
+            if booking.listing_id != current:
+                current = booking.listing_id
+                taken = held.pop(current, set())
+            for night in booking.nights():
+                if night in taken:
+                    conflicts.append((booking.listing_id, booking.pk, night))
+                    continue
+                taken.add(night)
+                batch.append(BookedNight(listing_id=booking.listing_id, booking_id=booking.pk, night=night))
+            if len(batch) >= batch_size:
+                BookedNight.objects.bulk_create(batch)
+                indexed += len(batch)
+                batch = []
+        BookedNight.objects.bulk_create(batch)
+        indexed += len(batch)
+    return indexed, conflicts
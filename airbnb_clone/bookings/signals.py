@@ -0,0 +1,22 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from listings.cache import invalidate_availability
+from .models import EARNING_STATUSES, BookedNight, Booking, record_stay, release_nights
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def expire_cached_availability(sender, instance, raw=False, **kwargs):
+    """Expire cached date searches after the booked nights change"""
+    if not raw:
+        invalidate_availability(instance.listing_id)
+
+@receiver(pre_delete, sender=Booking)
+def release_occupancy(sender, instance, **kwargs):
+    """Clear a deleted booking's nights from the occupancy calendar"""
+    release_nights(BookedNight.objects.filter(booking_id=instance.pk))
+
+@receiver(pre_delete, sender=Booking)
+def remove_earnings(sender, instance, **kwargs):
+    """Take a deleted booking's nights out of the daily stats"""
+    if instance.status in EARNING_STATUSES:
+        record_stay(instance.stay(), -1)
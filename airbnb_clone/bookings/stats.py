@@ -0,0 +1,106 @@
+import calendar
+from datetime import MAXYEAR, MINYEAR, date
+from decimal import Decimal
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from listings.models import Listing
+from .models import EARNING_STATUSES, Booking, ListingDailyStats
+
+def split_stays(listing_ids, check_ins, check_outs, cents):
+    """Spread stays over their nights with array arithmetic, summing nights and cents per listing and day"""
+    # Returns (listing_ids, days, nights, cents) arrays with one entry per
+    # listing-day; each stay's first night takes its rounding remainder
+    starts = np.asarray(check_ins, dtype='datetime64[D]')
+    lengths = (np.asarray(check_outs, dtype='datetime64[D]') - starts).astype(np.int64)
+    keep = lengths > 0
+    starts, lengths = starts[keep], lengths[keep]
+    listing_ids = np.asarray(listing_ids, dtype=np.int64)[keep]
+    cents = np.asarray(cents, dtype=np.int64)[keep]
+    if not lengths.sum():
+        empty = np.array([], dtype=np.int64)
+        return empty, empty.astype('datetime64[D]'), empty, empty
+    
+    # One element per night: the stay it belongs to and its offset into it
+    stay = np.repeat(np.arange(len(lengths)), lengths)
+    offset = np.arange(len(stay)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    base = cents // lengths
+    night_cents = base[stay] + np.where(offset == 0, (cents - base * lengths)[stay], 0)
+    night_listings = listing_ids[stay]
+    night_days = (starts[stay] + offset).astype(np.int64)
+    
+    # Sort by (listing, day) and sum each run of equal keys
+    order = np.lexsort((night_days, night_listings))
+    night_listings, night_days, night_cents = night_listings[order], night_days[order], night_cents[order]
+    new_key = np.ones(len(order), dtype=bool)
+    new_key[1:] = (np.diff(night_listings) != 0) | (np.diff(night_days) != 0)
+    firsts = np.flatnonzero(new_key)
+    return (
+        night_listings[firsts],
+        night_days[firsts].astype('datetime64[D]'),
+        np.diff(np.append(firsts, len(order))),
+        np.add.reduceat(night_cents, firsts),
+    )
+
+def rebuild_daily_stats(batch_size=500, listing_ids=None):
+    """Recompute the daily stats rollup from confirmed and completed bookings; returns the rows written"""
+    written = 0
+    if listing_ids is None:
+        listing_ids = list(Listing.objects.order_by('pk').values_list('pk', flat=True))
+    for index in range(0, len(listing_ids), batch_size):
+        batch = listing_ids[index:index + batch_size]
+        stays = list(
+            Booking.objects.filter(listing_id__in=batch, status__in=EARNING_STATUSES)
+            .values_list('listing_id', 'check_in', 'check_out', 'total_price')
+        )
+        columns = list(zip(*stays)) or [[], [], [], []]
+        cents = [int(round(price * 100)) for price in columns[3]]
+        ids, days, nights, totals = split_stays(columns[0], columns[1], columns[2], cents)
+        rows = [
+            ListingDailyStats(
+                listing_id=int(listing_id), day=day.item(), nights=int(count),
+                revenue=Decimal(int(total)) / 100,
+            )
+            for listing_id, day, count, total in zip(ids, days, nights, totals)
+        ]
+        with transaction.atomic():
+            ListingDailyStats.objects.filter(listing_id__in=batch).delete()
+            ListingDailyStats.objects.bulk_create(rows, batch_size=2000)
+        written += len(rows)
+    return written
+
+def parse_year(value, default):
+    """A stats year from a query parameter; ValueError unless it is a whole number date() accepts"""
+    year = int(value) if value else default
+    if not MINYEAR <= year <= MAXYEAR:
+        raise ValueError(f'year must be between {MINYEAR} and {MAXYEAR}')
+    return year
+
+def monthly_stats(listing_ids, year):
+    """Per-listing month rows of nights, occupancy rate, revenue and average daily rate for a year"""
+    totals = (
+        ListingDailyStats.objects.filter(listing_id__in=listing_ids, day__year=year)
+        .annotate(month=TruncMonth('day'))
+        .values('listing_id', 'month')
+        .annotate(nights=Sum('nights'), revenue=Sum('revenue'))
+        .order_by()
+    )
+    found = {(row['listing_id'], row['month'].month): row for row in totals}
+    stats = {}
+    for listing_id in listing_ids:
+        stats[listing_id] = []
+        for month in range(1, 13):
+            row = found.get((listing_id, month), {})
+            nights = row.get('nights') or 0
+            revenue = row.get('revenue') or Decimal('0.00')
+            days = calendar.monthrange(year, month)[1]
+            stats[listing_id].append({
+                'month': date(year, month, 1),
+                'nights': nights,
+                'days': days,
+                'occupancy_rate': round(nights / days, 4),
+                'revenue': revenue,
+                'average_daily_rate': (revenue / nights).quantize(Decimal('0.01')) if nights else None,
+            })
+    return stats
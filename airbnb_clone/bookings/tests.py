@@ -1,3 +1,403 @@
-from django.test import TestCase
+import csv
+import os
+import random
+import tempfile
+import threading
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from listings.models import Listing
+from reviews.models import RATING_FIELDS
+from users.models import User
+from .models import BookedNight, Booking, ListingDailyStats, OccupancyCalendar, check_occupancy, place_hold
+from .stats import rebuild_daily_stats, split_stays
 
-# Create your tests here.
+def make_listing(host):
+    return Listing.objects.create(
+        host=host, title='Cabin', description='A cabin', property_type='cabin',
+        street_address='1 Road', city='Aspen', state='Colorado', country='United States',
+        zip_code='81611', bedrooms=1, bathrooms=Decimal('1.0'), guests=2,
+        price_per_night=Decimal('120.00'),
+    )
+
+def future(days):
+    return timezone.now().date() + timedelta(days=days)
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Parallel booking attempts for the same nights"""
+    attempts = 12
+
+    def setUp(self):
+        host = User.objects.create(
+            username='host', email='host@example.com', user_type='host', profile_picture=''
+        )
+        self.listing = make_listing(host)
+        self.guests = [
+            User.objects.create(username=f'guest{i}', email=f'guest{i}@example.com', profile_picture='')
+            for i in range(self.attempts)
+        ]
+
+    def book_in_parallel(self, stays):
+        barrier = threading.Barrier(len(stays))
+        outcomes = []
+
+        def attempt(guest, check_in, check_out):
+            try:
+                barrier.wait()
+                Booking(
+                    guest=guest, listing=self.listing,
+                    check_in=check_in, check_out=check_out, guests=1,
+                ).save()
+                outcomes.append('booked')
+            except ValidationError:
+                outcomes.append('rejected')
+            except Exception as e:
+                outcomes.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=attempt, args=(guest, *stay))
+            for guest, stay in zip(self.guests, stays)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_exactly_one_of_many_identical_bookings_wins(self):
+        check_in = timezone.now().date() + timedelta(days=10)
+        outcomes = self.book_in_parallel([(check_in, check_in + timedelta(days=3))] * self.attempts)
+
+        self.assertEqual(outcomes.count('booked'), 1, outcomes)
+        self.assertEqual(outcomes.count('rejected'), self.attempts - 1, outcomes)
+        self.assertEqual(Booking.objects.filter(listing=self.listing).count(), 1)
+        self.assertEqual(BookedNight.objects.filter(listing=self.listing).count(), 3)
+
+    def test_overlapping_bookings_never_share_a_night(self):
+        start = timezone.now().date() + timedelta(days=10)
+        stays = [
+            (start + timedelta(days=i), start + timedelta(days=i + 2))
+            for i in range(self.attempts)
+        ]
+        outcomes = self.book_in_parallel(stays)
+
+        self.assertNotIn(False, [outcome in ('booked', 'rejected') for outcome in outcomes], outcomes)
+        bookings = list(Booking.objects.filter(listing=self.listing).order_by('check_in'))
+        self.assertEqual(len(bookings), outcomes.count('booked'))
+        for earlier, later in zip(bookings, bookings[1:]):
+            self.assertLessEqual(earlier.check_out, later.check_in)
+
+class HoldTests(TestCase):
+    """A guest's hold converts into their booking, or gives way to it"""
+
+    def setUp(self):
+        host = User.objects.create(
+            username='host', email='host@example.com', user_type='host', profile_picture=''
+        )
+        self.guest = User.objects.create(username='guest', email='guest@example.com', profile_picture='')
+        self.listing = make_listing(host)
+        place_hold(self.listing.pk, self.guest, future(10), future(13))
+
+    def book(self, guest, check_in, check_out):
+        return Booking.objects.create(
+            guest=guest, listing=self.listing, check_in=check_in, check_out=check_out, guests=1,
+        )
+
+    def booked_nights(self, booking):
+        return sorted(BookedNight.objects.filter(booking=booking).values_list('night', flat=True))
+
+    def test_exact_stay_converts_the_hold(self):
+        held = set(BookedNight.objects.values_list('pk', flat=True))
+        booking = self.book(self.guest, future(10), future(13))
+        self.assertEqual(set(BookedNight.objects.filter(booking=booking).values_list('pk', flat=True)), held)
+
+    def test_overlapping_stays_replace_the_guests_own_hold(self):
+        for check_in, check_out in ((future(11), future(14)), (future(10), future(12))):
+            with self.subTest(check_in=check_in, check_out=check_out):
+                booking = self.book(self.guest, check_in, check_out)
+                self.assertEqual(self.booked_nights(booking), [check_in + timedelta(days=offset)
+                                                               for offset in range(booking.num_nights)])
+                self.assertFalse(BookedNight.objects.filter(booking=None).exists())
+                booking.delete()
+                place_hold(self.listing.pk, self.guest, future(10), future(13))
+
+    def test_other_guests_cannot_book_held_nights(self):
+        other = User.objects.create(username='other', email='other@example.com', profile_picture='')
+        with self.assertRaises(ValidationError):
+            self.book(other, future(12), future(15))
+        self.assertEqual(BookedNight.objects.filter(held_by=self.guest).count(), 3)
+
+class OccupancyCalendarTests(TestCase):
+    """The packed calendars track every pending and confirmed night"""
+
+    def setUp(self):
+        host = User.objects.create(
+            username='host', email='host@example.com', user_type='host', profile_picture=''
+        )
+        self.guest = User.objects.create(username='guest', email='guest@example.com', profile_picture='')
+        self.listing = make_listing(host)
+
+    def book(self, check_in, check_out):
+        return Booking.objects.create(
+            guest=self.guest, listing=self.listing, check_in=check_in, check_out=check_out, guests=1,
+        )
+
+    def held(self):
+        """Every night set in the listing's calendars"""
+        nights = []
+        for calendar in OccupancyCalendar.objects.filter(listing=self.listing):
+            bits = calendar.bits
+            nights.extend(date(calendar.year, 1, 1) + timedelta(days=day)
+                          for day in range(bits.bit_length()) if bits >> day & 1)
+        return sorted(nights)
+
+    def test_save_transition_and_delete_set_and_clear_bits(self):
+        booking = self.book(future(10), future(12))
+        self.assertEqual(self.held(), [future(10), future(11)])
+        booking.check_in, booking.check_out = future(11), future(14)
+        booking.save()
+        self.assertEqual(self.held(), [future(11), future(12), future(13)])
+        booking.confirm()
+        self.assertEqual(len(self.held()), 3)
+        booking.cancel()
+        self.assertEqual(self.held(), [])
+        self.book(future(20), future(21)).delete()
+        self.assertEqual(self.held(), [])
+
+    def test_stay_across_new_year(self):
+        today = timezone.now().date()
+        check_in = date(today.year + 1, 12, 30)
+        self.book(check_in, check_in + timedelta(days=4))
+        years = OccupancyCalendar.objects.filter(listing=self.listing).order_by('year')
+        self.assertEqual(list(years.values_list('year', flat=True)), [today.year + 1, today.year + 2])
+        self.assertEqual(self.held(), [check_in + timedelta(days=offset) for offset in range(4)])
+        with self.assertRaises(ValidationError):
+            self.book(date(today.year + 2, 1, 1), date(today.year + 2, 1, 3))
+
+    def test_verify_occupancy_repairs_drift(self):
+        self.book(future(10), future(12))
+        calendar = OccupancyCalendar.objects.get(listing=self.listing)
+        calendar.bits = 0
+        calendar.save()
+        with self.assertRaises(CommandError):
+            call_command('verify_occupancy', stdout=StringIO())
+        self.assertEqual(self.held(), [])
+        call_command('verify_occupancy', '--repair', stdout=StringIO())
+        self.assertEqual(self.held(), [future(10), future(11)])
+        self.assertEqual(check_occupancy(), [])
+
+class RebuildBookedNightsTests(TestCase):
+    """rebuild_booked_nights restores the index without dropping holds or hiding double bookings"""
+
+    def setUp(self):
+        host = User.objects.create(
+            username='host', email='host@example.com', user_type='host', profile_picture=''
+        )
+        self.guest = User.objects.create(username='guest', email='guest@example.com', profile_picture='')
+        self.listing = make_listing(host)
+        self.booking = Booking.objects.create(
+            guest=self.guest, listing=self.listing, check_in=future(10), check_out=future(13), guests=1,
+        )
+        place_hold(self.listing.pk, self.guest, future(20), future(22))
+
+    def rebuild(self):
+        out = StringIO()
+        call_command('rebuild_booked_nights', stdout=out)
+        return out.getvalue()
+
+    def test_restores_booked_nights_and_keeps_live_holds(self):
+        BookedNight.objects.filter(booking=self.booking).delete()
+        self.assertIn('Indexed 3 booked nights', self.rebuild())
+        self.assertEqual(BookedNight.objects.filter(booking=self.booking).count(), 3)
+        self.assertEqual(BookedNight.objects.filter(held_by=self.guest).count(), 2)
+
+    def test_reports_double_bookings(self):
+        # Written around save(), as a stored double booking would have been
+        double = Booking.objects.bulk_create([Booking(
+            guest=self.guest, listing=self.listing, check_in=future(12), check_out=future(15),
+            guests=1, total_price=Decimal('360.00'),
+        )])[0]
+        with self.assertRaisesMessage(CommandError, 'Found 1 double-booked nights'):
+            self.rebuild()
+        self.assertEqual(
+            sorted(BookedNight.objects.filter(booking=double).values_list('night', flat=True)),
+            [future(13), future(14)],
+        )
+        self.assertEqual(BookedNight.objects.filter(held_by=self.guest).count(), 2)
+
+class DailyStatsTests(TestCase):
+    """The daily stats rollup follows every change to an earning booking"""
+
+    def setUp(self):
+        self.host = User.objects.create(
+            username='host', email='host@example.com', user_type='host', profile_picture=''
+        )
+        self.guest = User.objects.create(username='guest', email='guest@example.com', profile_picture='')
+        self.listing = make_listing(self.host)
+
+    def book(self, check_in, check_out, status='confirmed', total_price=Decimal('100.00')):
+        return Booking.objects.create(
+            guest=self.guest, listing=self.listing, check_in=check_in, check_out=check_out,
+            guests=1, total_price=total_price, status=status,
+        )
+
+    def earned(self):
+        """Days with nights or revenue, as {day: (nights, revenue)}, after checking a rebuild agrees"""
+        rows = ListingDailyStats.objects.filter(listing=self.listing).exclude(nights=0, revenue=0)
+        earned = {day: (nights, revenue) for day, nights, revenue in rows.values_list('day', 'nights', 'revenue')}
+        rebuild_daily_stats()
+        rebuilt = ListingDailyStats.objects.filter(listing=self.listing).values_list('day', 'nights', 'revenue')
+        self.assertEqual({day: (nights, revenue) for day, nights, revenue in rebuilt}, earned)
+        return earned
+
+    def test_confirmed_stay_splits_its_cents_over_its_nights(self):
+        self.book(future(10), future(13))
+        self.assertEqual(self.earned(), {
+            future(10): (1, Decimal('33.34')),
+            future(11): (1, Decimal('33.33')),
+            future(12): (1, Decimal('33.33')),
+        })
+
+    def test_pending_stays_earn_once_confirmed(self):
+        booking = self.book(future(10), future(12), status='pending')
+        self.assertEqual(self.earned(), {})
+        booking.confirm()
+        self.assertEqual(self.earned(), {future(10): (1, Decimal('50.00')), future(11): (1, Decimal('50.00'))})
+        booking.complete()
+        self.assertEqual(len(self.earned()), 2)
+
+    def test_cancel_removes_the_stay(self):
+        self.book(future(20), future(22), total_price=Decimal('80.00'))
+        booking = self.book(future(10), future(12))
+        booking.cancel()
+        self.assertEqual(self.earned(), {future(20): (1, Decimal('40.00')), future(21): (1, Decimal('40.00'))})
+
+    def test_date_change_moves_the_stay(self):
+        booking = self.book(future(10), future(12))
+        booking.check_in, booking.check_out = future(11), future(14)
+        booking.save()
+        self.assertEqual(self.earned(), {
+            future(11): (1, Decimal('33.34')),
+            future(12): (1, Decimal('33.33')),
+            future(13): (1, Decimal('33.33')),
+        })
+
+    def test_delete_removes_the_stay(self):
+        self.book(future(10), future(12)).delete()
+        self.assertEqual(self.earned(), {})
+
+    def test_split_stays_matches_a_per_night_loop(self):
+        rng = random.Random(7)
+        start = future(0)
+        stays = []
+        for _ in range(300):
+            check_in = start + timedelta(days=rng.randrange(400))
+            stays.append((rng.randrange(1, 6), check_in, check_in + timedelta(days=rng.randrange(0, 15)),
+                          rng.randrange(0, 500000)))
+        nights, cents = Counter(), Counter()
+        for listing_id, check_in, check_out, total in stays:
+            length = (check_out - check_in).days
+            for offset in range(length):
+                key = (listing_id, check_in + timedelta(days=offset))
+                nights[key] += 1
+                cents[key] += total // length + (total % length if offset == 0 else 0)
+
+        ids, days, counts, totals = split_stays(*zip(*stays))
+        self.assertEqual(
+            {(int(i), day.item()): (int(count), int(total)) for i, day, count, total in zip(ids, days, counts, totals)},
+            {key: (nights[key], cents[key]) for key in nights},
+        )
+        self.assertEqual(len(split_stays([], [], [], [])[0]), 0)
+
+class ImportHistoryTests(TestCase):
+    """import_history validates a batch as a whole and claims nights like a live booking"""
+
+    def setUp(self):
+        host = User.objects.create(
+            username='host', email='host@example.com', user_type='host', profile_picture=''
+        )
+        self.guest = User.objects.create(username='guest', email='guest@example.com', profile_picture='')
+        self.listing = make_listing(host)
+
+    def run_import(self, rows):
+        """Import rows as a CSV file; returns (stdout, stderr)"""
+        columns = ['listing_id', 'guest_email', 'check_in', 'check_out', 'guests', 'status',
+                   *[f'review_{name}' for name in RATING_FIELDS]]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'stays.csv')
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, columns)
+                writer.writeheader()
+                for row in rows:
+                    writer.writerow({'listing_id': self.listing.pk, 'guest_email': 'guest@example.com',
+                                     'guests': 1, **row})
+            out, err = StringIO(), StringIO()
+            call_command('import_history', path, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_overlapping_rows_in_a_batch_are_rejected(self):
+        out, err = self.run_import([
+            {'check_in': future(30), 'check_out': future(33), 'status': 'confirmed'},
+            {'check_in': future(32), 'check_out': future(34), 'status': 'pending'},
+            {'check_in': future(31), 'check_out': future(32), 'status': 'cancelled'},
+            {'check_in': future(40), 'check_out': future(42), 'status': 'confirmed'},
+        ])
+        self.assertEqual(err.splitlines(), [
+            'Line 2: Overlaps another stay at this listing.',
+            'Line 3: Overlaps another stay at this listing.',
+        ])
+        self.assertIn('Imported 2 bookings and 0 reviews; rejected 2 rows', out)
+
+    def test_rows_overlapping_stored_stays_or_holds_are_rejected(self):
+        Booking.objects.create(
+            guest=self.guest, listing=self.listing, check_in=future(10), check_out=future(13), guests=1,
+        )
+        other = User.objects.create(username='other', email='other@example.com', profile_picture='')
+        place_hold(self.listing.pk, other, future(20), future(22))
+        _, err = self.run_import([
+            {'check_in': future(11), 'check_out': future(12), 'status': 'confirmed'},
+            {'check_in': future(13), 'check_out': future(15), 'status': 'confirmed'},
+            {'check_in': future(18), 'check_out': future(21), 'status': 'pending'},
+        ])
+        self.assertEqual(err.splitlines(), [
+            'Line 2: Overlaps another stay at this listing.',
+            'Line 4: Overlaps another stay at this listing.',
+        ])
+        self.assertEqual(BookedNight.objects.filter(held_by=other).count(), 2)
+
+    def test_imported_rows_update_the_index_calendar_and_stats(self):
+        scores = {f'review_{name}': 4 for name in RATING_FIELDS}
+        out, err = self.run_import([
+            {'check_in': future(-10), 'check_out': future(-7), 'status': 'completed', **scores},
+            {'check_in': future(5), 'check_out': 'soon', 'status': 'confirmed'},
+            {'check_in': future(5), 'check_out': future(8), 'status': 'confirmed'},
+            {'check_in': future(9), 'check_out': future(10), 'status': 'pending'},
+        ])
+        self.assertEqual(err.splitlines(), ['Line 3: check_out must be a date (YYYY-MM-DD).'])
+        self.assertIn('Imported 3 bookings and 1 reviews; rejected 1 rows', out)
+
+        self.assertEqual(
+            sorted(BookedNight.objects.filter(listing=self.listing).values_list('night', flat=True)),
+            [future(5), future(6), future(7), future(9)],
+        )
+        self.assertEqual(check_occupancy(), [])
+        stats = ListingDailyStats.objects.filter(listing=self.listing).values_list('day', 'nights', 'revenue')
+        imported = sorted(stats)
+        self.assertEqual([day for day, _, _ in imported],
+                         [future(-10), future(-9), future(-8), future(5), future(6), future(7)])
+        rebuild_daily_stats()
+        self.assertEqual(sorted(stats), imported)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.review_count, 1)
+        with self.assertRaises(ValidationError):
+            Booking.objects.create(
+                guest=self.guest, listing=self.listing, check_in=future(6), check_out=future(8), guests=1,
+            )
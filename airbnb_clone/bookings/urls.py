@@ -5,7 +5,10 @@ urlpatterns = [
     path('', views.BookingListView.as_view(), name='booking_list'),
     path('<int:pk>/', views.BookingDetailView.as_view(), name='booking_detail'),
     path('listing/<int:listing_pk>/create/', views.create_booking, name='create_booking'),
+    path('listing/<int:listing_pk>/hold/', views.hold_dates, name='hold_dates'),
     path('<int:pk>/cancel/', views.cancel_booking, name='cancel_booking'),
     path('<int:pk>/confirm/', views.confirm_booking, name='confirm_booking'),
-    path('host/', views.host_bookings, name='host_bookings'),
+    path('host/', views.HostBookingListView.as_view(), name='host_bookings'),
+    path('host/export/', views.export_host_bookings, name='host_bookings_export'),
+    path('host/stats/', views.host_stats, name='host_stats'),
 ]
\ No newline at end of file
@@ -1,13 +1,27 @@
+import csv
+import json
+import uuid
+from itertools import chain
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, UpdateView, DeleteView
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.core.exceptions import ValidationError
-from .models import Booking
-from .forms import BookingForm
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Q, Sum
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import urlencode
+from django.views.decorators.http import require_POST
+from airbnb_clone.pagination import KeysetPaginationMixin
+from api.idempotency import HEADER, IdempotencyError, run_once
+from .models import Booking, InvalidTransition, period_filters, place_hold
+from .forms import BookingForm, HostBookingFilterForm
+from .stats import monthly_stats, parse_year
 from listings.models import Listing
+from listings.views import parse_stay_dates
 
 @login_required
 def create_booking(request, listing_pk):
@@ -21,39 +35,84 @@ def create_booking(request, listing_pk):
     
     if request.method == 'POST':
         form = BookingForm(request.POST, listing=listing)
-        if form.is_valid():
-            try:
-                booking = form.save(commit=False)
-                booking.guest = request.user
-                booking.listing = listing
-                
-                # Calculate total price before saving
-                check_in = form.cleaned_data['check_in']
-                check_out = form.cleaned_data['check_out']
-                num_nights = (check_out - check_in).days
-                booking.total_price = num_nights * listing.price_per_night
-                
-                # Now save the booking (this will trigger validation)
-                booking.save()
-                
-                messages.success(request, 'Booking created successfully! Waiting for host confirmation.')
-                return redirect('booking_detail', pk=booking.pk)
-                
-            except ValidationError as e:
-                # Display validation errors to user
-                for error in e.messages:
-                    messages.error(request, error)
-            except Exception as e:
-                messages.error(request, f'An error occurred: {str(e)}')
-    else:
-        form = BookingForm(listing=listing)
+        # Resubmissions of one rendered form (double clicks, retries) carry the
+        # same key and get the first submission's redirect back
+        key = request.headers.get(HEADER) or request.POST.get('idempotency_key')
+        try:
+            return run_once(
+                request, f'bookings:create:{listing.pk}', key,
+                lambda: _submit_booking(request, form, listing),
+            )
+        except IdempotencyError as e:
+            messages.error(request, e.message)
+            return redirect('booking_list')
+    
+    form = BookingForm(listing=listing)
+    
+    # Dates chosen in search prefill the form; hold_dates (a POST) holds them
+    stay = parse_stay_dates(request.GET)
+    if stay:
+        form = BookingForm(listing=listing, initial={'check_in': stay[0], 'check_out': stay[1]})
+    
+    return _booking_form(request, form, listing)
+
+@login_required
+@require_POST
+def hold_dates(request, listing_pk):
+    """Hold the chosen dates while the guest fills in the booking form"""
+    listing = get_object_or_404(Listing, pk=listing_pk, is_active=True)
+    if request.user == listing.host:
+        messages.error(request, 'You cannot book your own property.')
+        return redirect('listing_detail', pk=listing_pk)
+    
+    url = reverse('create_booking', args=[listing.pk])
+    stay = parse_stay_dates(request.POST)
+    if not stay:
+        return redirect(url)
+    try:
+        expires_at = place_hold(listing.pk, request.user, *stay)
+        messages.info(request, f'These dates are held for you until {timezone.localtime(expires_at):%H:%M}.')
+    except ValidationError as e:
+        for error in e.messages:
+            messages.error(request, error)
+    return redirect(f"{url}?{urlencode({'check_in': stay[0], 'check_out': stay[1]})}")
+
+def _submit_booking(request, form, listing):
+    if form.is_valid():
+        try:
+            booking = form.save(commit=False)
+            booking.guest = request.user
+            booking.listing = listing
+            
+            # Calculate total price before saving
+            check_in = form.cleaned_data['check_in']
+            check_out = form.cleaned_data['check_out']
+            num_nights = (check_out - check_in).days
+            booking.total_price = num_nights * listing.price_per_night
+            
+            # Now save the booking (this will trigger validation)
+            booking.save()
+            
+            messages.success(request, 'Booking created successfully! Waiting for host confirmation.')
+            return redirect('booking_detail', pk=booking.pk)
+            
+        except ValidationError as e:
+            # Display validation errors to user
+            for error in e.messages:
+                messages.error(request, error)
+        except Exception as e:
+            messages.error(request, f'An error occurred: {str(e)}')
     
+    return _booking_form(request, form, listing)
+
+def _booking_form(request, form, listing):
     return render(request, 'bookings/booking_form.html', {
         'form': form,
-        'listing': listing
+        'listing': listing,
+        'idempotency_key': request.POST.get('idempotency_key') or uuid.uuid4().hex,
     })
 
-class BookingListView(LoginRequiredMixin, ListView):
+class BookingListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """View for listing user's bookings"""
     model = Booking
     template_name = 'bookings/booking_list.html'
@@ -78,34 +137,121 @@ def cancel_booking(request, pk):
     """View for cancelling a booking"""
     booking = get_object_or_404(Booking, pk=pk, guest=request.user)
     
-    if booking.status in ['pending', 'confirmed'] and booking.is_upcoming:
-        booking.status = 'cancelled'
-        booking.save()
-        messages.success(request, 'Booking cancelled successfully.')
-    else:
+    if not booking.is_upcoming:
         messages.error(request, 'This booking cannot be cancelled.')
+        return redirect('booking_detail', pk=pk)
+    
+    try:
+        booking.cancel()
+        messages.success(request, 'Booking cancelled successfully.')
+    except InvalidTransition as e:
+        messages.error(request, e.messages[0])
     
     return redirect('booking_detail', pk=pk)
 
-@login_required
-def host_bookings(request):
+# Export columns: header -> lookup
+EXPORT_COLUMNS = {
+    'id': 'id',
+    'listing_id': 'listing_id',
+    'listing': 'listing__title',
+    'guest': 'guest__username',
+    'check_in': 'check_in',
+    'check_out': 'check_out',
+    'guests': 'guests',
+    'total_price': 'total_price',
+    'status': 'status',
+    'created_at': 'created_at',
+}
+# Rows fetched per round trip while streaming an export
+EXPORT_CHUNK_SIZE = 2000
+
+def host_summary(bookings):
+    """Dashboard counts and revenue for a host's bookings, from one aggregate query"""
+    periods = period_filters(timezone.now().date())
+    return bookings.aggregate(
+        total=Count('pk'),
+        pending=Count('pk', filter=Q(status='pending')),
+        confirmed=Count('pk', filter=Q(status='confirmed')),
+        completed=Count('pk', filter=Q(status='completed')),
+        **{name: Count('pk', filter=condition) for name, condition in periods.items()},
+        revenue=Sum('total_price', filter=~Q(status='cancelled')),
+    )
+
+class HostBookingListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """View for hosts to see bookings for their listings"""
-    bookings = Booking.objects.filter(
-        listing__host=request.user
-    ).select_related('guest', 'listing').order_by('-created_at')
+    model = Booking
+    template_name = 'bookings/host_bookings.html'
+    context_object_name = 'bookings'
+    paginate_by = 20
     
-    return render(request, 'bookings/host_bookings.html', {'bookings': bookings})
+    def get_queryset(self):
+        self.filter_form = HostBookingFilterForm(self.request.GET)
+        bookings = self.filter_form.filter(Booking.objects.filter(listing__host=self.request.user))
+        return bookings.select_related('guest', 'listing', 'review').order_by('-created_at')
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['filter_form'] = self.filter_form
+        context['summary'] = host_summary(Booking.objects.filter(listing__host=self.request.user))
+        return context
+
+@login_required
+def host_stats(request):
+    """View for hosts to see monthly earnings and occupancy per listing"""
+    try:
+        year = parse_year(request.GET.get('year'), timezone.now().year)
+    except ValueError:
+        return HttpResponseBadRequest('Pass a year such as 2026.')
+    listings = list(Listing.objects.filter(host=request.user).only('id', 'title').order_by('title'))
+    stats = monthly_stats([listing.pk for listing in listings], year)
+    
+    return render(request, 'bookings/host_stats.html', {
+        'year': year,
+        'rows': [(listing, stats[listing.pk]) for listing in listings],
+    })
+
+class Echo:
+    """File-like object handing back each written line, for streaming csv.writer output"""
+    def write(self, value):
+        return value
+
+@login_required
+def export_host_bookings(request):
+    """View for streaming a host's filtered bookings as CSV or NDJSON"""
+    bookings = HostBookingFilterForm(request.GET).filter(
+        Booking.objects.filter(listing__host=request.user)
+    )
+    # iterator() streams from a server-side cursor where the database has one
+    # (PostgreSQL) and fetches in chunks elsewhere, so memory stays flat
+    rows = bookings.order_by('-created_at', '-pk').values_list(
+        *EXPORT_COLUMNS.values()
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    
+    if request.GET.get('format') == 'ndjson':
+        lines = (
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), cls=DjangoJSONEncoder) + '\n'
+            for row in rows
+        )
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        extension = 'ndjson'
+    else:
+        writer = csv.writer(Echo())
+        lines = chain([writer.writerow(EXPORT_COLUMNS)], (writer.writerow(row) for row in rows))
+        response = StreamingHttpResponse(lines, content_type='text/csv')
+        extension = 'csv'
+    
+    response['Content-Disposition'] = f'attachment; filename="bookings-{timezone.now().date()}.{extension}"'
+    return response
 
 @login_required
 def confirm_booking(request, pk):
     """View for hosts to confirm bookings"""
     booking = get_object_or_404(Booking, pk=pk, listing__host=request.user)
     
-    if booking.status == 'pending':
-        booking.status = 'confirmed'
-        booking.save()
+    try:
+        booking.confirm()
         messages.success(request, 'Booking confirmed successfully.')
-    else:
-        messages.error(request, 'This booking cannot be confirmed.')
+    except InvalidTransition as e:
+        messages.error(request, e.messages[0])
     
     return redirect('booking_detail', pk=pk)
\ No newline at end of file
@@ -11,7 +11,7 @@ class ListingImageInline(admin.TabularInline):
 class ListingAdmin(admin.ModelAdmin):
     """Admin interface for Listing model"""
     list_display = ['title', 'host', 'property_type', 'city', 'country', 
-                   'price_per_night', 'is_active', 'created_at']
+                   'price_per_night', 'review_count', 'is_active', 'created_at']
     list_filter = ['property_type', 'is_active', 'city', 'country', 'created_at']
     search_fields = ['title', 'description', 'city', 'country', 'host__username']
     list_editable = ['is_active']
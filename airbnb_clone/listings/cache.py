@@ -0,0 +1,175 @@
+import hashlib
+import json
+import re
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .search import SEARCH_COLUMNS, tokenize
+
+# Cached listing searches. Entries are keyed on the normalized query plus the
+# current value of the version counters it depends on, so a write expires
+# entries by bumping a counter instead of deleting keys. Searches scoped by a
+# place name depend only on the counters of their terms; everything else
+# depends on the global counter, and date searches also on availability.
+
+KEY_PREFIX = 'listing-search'
+GLOBAL_VERSION = f'{KEY_PREFIX}:v:global'
+AVAILABILITY_VERSION = f'{KEY_PREFIX}:v:availability'
+
+SCOPED_PARAMS = ('location', 'search', 'city', 'country')
+CASE_INSENSITIVE_PARAMS = SCOPED_PARAMS + ('property_type',)
+LIST_PARAMS = ('amenities',)
+DATE_PARAMS = ('check_in', 'check_out')
+# Search matches prefixes and close spellings sharing the first two letters,
+# so term versions are bucketed by that prefix rather than by the whole word
+TERM_BUCKET_LENGTH = 2
+
+STATS = ('hits', 'misses', 'coalesced')
+LOCK_TIMEOUT = 10
+WAIT_TIMEOUT = 2.0
+POLL_INTERVAL = 0.05
+
+def term_version_key(term):
+    return f'{KEY_PREFIX}:v:term:{term[:TERM_BUCKET_LENGTH]}'
+
+def _new_version():
+    return uuid.uuid4().hex
+
+def normalize_params(params, ignore=()):
+    """Canonical, order-independent form of a query string"""
+    normalized = []
+    for name in sorted(params.keys()):
+        if name in ignore:
+            continue
+        values = [value.strip() for value in params.getlist(name) if value.strip()]
+        if name in LIST_PARAMS:
+            values = sorted({part.strip().lower() for value in values for part in value.split(',') if part.strip()})
+        elif name in CASE_INSENSITIVE_PARAMS:
+            values = [' '.join(value.lower().split()) for value in values]
+        if values:
+            normalized.append([name, values])
+    return normalized
+
+def _version_keys(normalized):
+    params = dict((name, values) for name, values in normalized)
+    keys = sorted({
+        term_version_key(term)
+        for name in SCOPED_PARAMS for value in params.get(name, []) for term in tokenize(value)
+    }) or [GLOBAL_VERSION]
+    if any(name in params for name in DATE_PARAMS):
+        keys.append(AVAILABILITY_VERSION)
+    return keys
+
+def _versions(keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # A fresh value, never 'missing', so an evicted counter cannot revive stale entries
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+def cache_key(scope, params, ignore=()):
+    """Versioned cache key for a search described by query params"""
+    normalized = normalize_params(params, ignore)
+    versions = _versions(_version_keys(normalized))
+    payload = json.dumps([scope, normalized, versions], separators=(',', ':'))
+    return f'{KEY_PREFIX}:{scope}:{hashlib.sha256(payload.encode()).hexdigest()}'
+
+def _record(stat):
+    key = f'{KEY_PREFIX}:stats:{stat}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+def stats():
+    """Hit/miss counters since the last reset"""
+    values = cache.get_many([f'{KEY_PREFIX}:stats:{stat}' for stat in STATS])
+    counts = {stat: values.get(f'{KEY_PREFIX}:stats:{stat}', 0) for stat in STATS}
+    lookups = sum(counts.values())
+    counts['hit_rate'] = (counts['hits'] + counts['coalesced']) / lookups if lookups else 0.0
+    return counts
+
+def reset_stats():
+    cache.delete_many([f'{KEY_PREFIX}:stats:{stat}' for stat in STATS])
+
+def get_or_compute(key, compute):
+    """Cached value for key, letting a single caller recompute it on a miss"""
+    value = cache.get(key)
+    if value is not None:
+        _record('hits')
+        return value
+
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        # Another request is computing this result; wait for it rather than piling on
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL)
+            value = cache.get(key)
+            if value is not None:
+                _record('coalesced')
+                return value
+        _record('misses')
+        return compute()
+
+    try:
+        value = compute()
+        cache.set(key, value, settings.LISTING_SEARCH_CACHE_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+    _record('misses')
+    return value
+
+def rows_in_order(queryset, ids):
+    """Fetch the rows for cached ids, keeping the cached order"""
+    rows = queryset.in_bulk(ids)
+    return [rows[pk] for pk in ids if pk in rows]
+
+def _bump(keys):
+    def bump():
+        cache.set_many(dict.fromkeys(keys, _new_version()), None)
+    # Bump now for this transaction's own reads, and again on commit in case
+    # another request cached the pre-commit rows in between
+    bump()
+    transaction.on_commit(bump)
+
+def invalidate_listing(listing):
+    """Expire cached searches that a saved or deleted listing may appear in"""
+    # Bump the terms of the text as saved and as it was loaded, so the listing
+    # drops out of searches for its old city as well as joining the new one
+    sources = [{field: getattr(listing, field) for field in SEARCH_COLUMNS}]
+    loaded = getattr(listing, '_loaded_values', None)
+    if loaded:
+        sources.append(loaded)
+    keys = {GLOBAL_VERSION} | {
+        term_version_key(term)
+        for source in sources for field in SEARCH_COLUMNS
+        for term in re.findall(r'\w+', (source.get(field) or '').lower())
+    }
+    _bump(keys)
+
+def invalidate_availability(listing_id=None):
+    """Expire cached date searches, and the listing's calendar, after a booking change"""
+    keys = [AVAILABILITY_VERSION]
+    if listing_id is not None:
+        keys.append(listing_availability_version_key(listing_id))
+    _bump(keys)
+
+def listing_availability_version_key(listing_id):
+    return f'{KEY_PREFIX}:v:availability:{listing_id}'
+
+def listing_availability_versions(listing_ids):
+    """Current availability version of each listing, creating any that are missing"""
+    keys = {listing_id: listing_availability_version_key(listing_id) for listing_id in listing_ids}
+    versions = cache.get_many(keys.values())
+    missing = {key: _new_version() for key in keys.values() if key not in versions}
+    if missing:
+        # A concurrent initializer may overwrite these; that only costs a recompute
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {listing_id: versions[key] for listing_id, key in keys.items()}
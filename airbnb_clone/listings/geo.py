@@ -0,0 +1,121 @@
+import math
+import numpy as np
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 8
+EARTH_RADIUS_KM = 6371.0088
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 500
+# Upper bound on geohash prefixes OR'd together when prefiltering a box
+MAX_COVER_CELLS = 32
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Encode a coordinate as a base32 geohash"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell at the given precision"""
+    lng_bits = math.ceil(precision * 5 / 2)
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+def _steps(start, stop, step):
+    values = []
+    current = start
+    while current < stop:
+        values.append(current)
+        current += step
+    values.append(stop)
+    return values
+
+def covering_cells(min_lat, min_lng, max_lat, max_lng, max_cells=MAX_COVER_CELLS):
+    """Geohash prefixes whose cells cover the box, or [] if the box is too large to prefilter"""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.floor(max_lat / height) - math.floor(min_lat / height) + 1
+        columns = math.floor(max_lng / width) - math.floor(min_lng / width) + 1
+        if rows * columns <= max_cells:
+            return sorted({
+                encode_geohash(lat, lng, precision)
+                for lat in _steps(min_lat, max_lat, height)
+                for lng in _steps(min_lng, max_lng, width)
+            })
+    return []
+
+def bounding_box(latitude, longitude, radius_km):
+    """(min_lat, min_lng, max_lat, max_lng) enclosing a circle; min_lng > max_lng across the antimeridian"""
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = max(latitude - delta_lat, -90.0)
+    max_lat = min(latitude + delta_lat, 90.0)
+    if min_lat == -90.0 or max_lat == 90.0:
+        return min_lat, -180.0, max_lat, 180.0
+    delta_lng = math.degrees(
+        math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude))))
+    )
+    min_lng = longitude - delta_lng
+    max_lng = longitude + delta_lng
+    if min_lng < -180.0:
+        min_lng += 360.0
+    if max_lng > 180.0:
+        max_lng -= 360.0
+    return min_lat, min_lng, max_lat, max_lng
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Great-circle distances from one point to arrays of points"""
+    lat1 = np.radians(latitude)
+    lat2 = np.radians(np.asarray(latitudes, dtype=float))
+    delta_lat = lat2 - lat1
+    delta_lng = np.radians(np.asarray(longitudes, dtype=float) - longitude)
+    a = np.sin(delta_lat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(delta_lng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def parse_point(value):
+    """Parse 'lat,lng' into floats, or None if invalid"""
+    try:
+        latitude, longitude = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        return None
+    if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+        return latitude, longitude
+    return None
+
+def parse_radius(value):
+    """Parse a radius in km, defaulting and capping it"""
+    try:
+        radius = float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_RADIUS_KM
+    if not math.isfinite(radius) or radius <= 0:
+        return DEFAULT_RADIUS_KM
+    return min(radius, MAX_RADIUS_KM)
+
+def parse_bbox(value):
+    """Parse 'min_lng,min_lat,max_lng,max_lat' into (min_lat, min_lng, max_lat, max_lng), or None"""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= 180 and -180 <= max_lng <= 180):
+        return None
+    return min_lat, min_lng, max_lat, max_lng
@@ -0,0 +1,99 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from listings.geo import encode_geohash, haversine_km
+from listings.models import Listing
+
+User = get_user_model()
+
+class Rollback(Exception):
+    pass
+
+class Command(BaseCommand):
+    help = 'Benchmarks radius and bounding-box listing search over synthetic listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1000000, help='Number of listings to generate')
+        parser.add_argument('--cities', type=int, default=200, help='Number of listing clusters')
+        parser.add_argument('--radius', type=float, default=5.0, help='Search radius in km')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--naive', action='store_true',
+                            help='Also time a full scan with in-memory distance filtering')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        host = User.objects.create(username='bench-host', email='bench-host@example.com',
+                                   profile_picture='')
+        centers = [(random.uniform(-60, 70), random.uniform(-180, 180)) for _ in range(options['cities'])]
+        
+        started = time.perf_counter()
+        batch = []
+        for i in range(options['count']):
+            center_lat, center_lng = random.choice(centers)
+            latitude = max(-89.9, min(89.9, random.gauss(center_lat, 0.2)))
+            longitude = (random.gauss(center_lng, 0.2) + 180) % 360 - 180
+            batch.append(Listing(
+                host=host, title=f'Bench listing {i}', description='Benchmark',
+                property_type='apartment', street_address='1 Main Street', city='Bench City',
+                state='State', country='Country', zip_code='00000', bedrooms=1,
+                bathrooms=Decimal('1.0'), guests=2, price_per_night=Decimal('100.00'),
+                latitude=Decimal(f'{latitude:.6f}'), longitude=Decimal(f'{longitude:.6f}'),
+                geohash=encode_geohash(latitude, longitude),
+            ))
+            if len(batch) == 10000:
+                Listing.objects.bulk_create(batch, batch_size=1000)
+                batch = []
+        Listing.objects.bulk_create(batch, batch_size=1000)
+        self.stdout.write(f'Generated {options["count"]} listings in {time.perf_counter() - started:.1f}s')
+        
+        points = []
+        for _ in range(options['repeat']):
+            center_lat, center_lng = random.choice(centers)
+            points.append((center_lat + random.uniform(-0.1, 0.1), center_lng + random.uniform(-0.1, 0.1)))
+        
+        radius = options['radius']
+        near_times, bbox_times, results = [], [], []
+        for latitude, longitude in points:
+            started = time.perf_counter()
+            page = list(
+                Listing.objects.filter(is_active=True).near(latitude, longitude, radius)
+                .order_by('distance_km').values_list('pk', 'distance_km')[:20]
+            )
+            near_times.append((time.perf_counter() - started) * 1000)
+            results.append(len(page))
+            
+            started = time.perf_counter()
+            list(Listing.objects.filter(is_active=True).within_bbox(
+                latitude - 0.05, longitude - 0.05, latitude + 0.05, longitude + 0.05
+            ).values_list('pk', flat=True)[:20])
+            bbox_times.append((time.perf_counter() - started) * 1000)
+        
+        self.stdout.write(f'near (radius {radius} km): median {statistics.median(near_times):.2f} ms, '
+                          f'max {max(near_times):.2f} ms, median results {statistics.median(results)}')
+        self.stdout.write(f'bbox (0.1 deg): median {statistics.median(bbox_times):.2f} ms, '
+                          f'max {max(bbox_times):.2f} ms')
+        
+        if options['naive']:
+            naive_times = []
+            for latitude, longitude in points[:3]:
+                started = time.perf_counter()
+                ids, latitudes, longitudes = zip(*Listing.objects.filter(
+                    is_active=True, latitude__isnull=False
+                ).values_list('pk', 'latitude', 'longitude'))
+                distances = haversine_km(latitude, longitude, latitudes, longitudes)
+                sorted(i for i, distance in zip(ids, distances) if distance <= radius)
+                naive_times.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(f'full scan: median {statistics.median(naive_times):.2f} ms')
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from listings.models import ListingImage
+from listings.renditions import generate_renditions, needs_renditions
+
+class Command(BaseCommand):
+    help = 'Generates thumbnail, card and full-size renditions for listing images that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate renditions for every image')
+
+    def handle(self, *args, **options):
+        rendered = failed = 0
+        for image in ListingImage.objects.order_by('pk').iterator():
+            if not options['all'] and not needs_renditions(image):
+                continue
+            try:
+                generate_renditions(image)
+            except OSError as e:
+                failed += 1
+                self.stderr.write(f'Image {image.pk} ({image.image.name}): {e}')
+                continue
+            rendered += 1
+        
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} images'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} images could not be rendered'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from listings.search import rebuild_index
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text listing search index'
+
+    def handle(self, *args, **kwargs):
+        if connection.vendor != 'sqlite':
+            self.stdout.write(self.style.WARNING(
+                f'The {connection.vendor} search index is maintained by the database; nothing to do'
+            ))
+            return
+        
+        with transaction.atomic():
+            rebuild_index()
+        
+        self.stdout.write(self.style.SUCCESS('Rebuilt the listing search index'))
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from listings.cache import reset_stats, stats
+
+class Command(BaseCommand):
+    help = 'Reports search result cache hits and misses (needs a shared cache backend)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after reporting')
+
+    def handle(self, *args, **options):
+        backend = settings.CACHES['default']['BACKEND']
+        if backend.endswith('LocMemCache'):
+            self.stdout.write(self.style.WARNING(
+                'The local-memory cache is per process; counters here do not include the web server'
+            ))
+        
+        counts = stats()
+        self.stdout.write(
+            f"hits={counts['hits']} coalesced={counts['coalesced']} misses={counts['misses']} "
+            f"hit_rate={counts['hit_rate']:.1%}"
+        )
+        
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Reset the search cache counters'))
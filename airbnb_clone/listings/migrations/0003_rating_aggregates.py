@@ -0,0 +1,72 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    Review = apps.get_model('reviews', 'Review')
+    reviews = Review.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+    updates = {
+        'review_count': Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0),
+        'rating_sum': Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0),
+    }
+    for name in ('cleanliness', 'communication', 'check_in', 'accuracy', 'location', 'value'):
+        updates[f'{name}_sum'] = Coalesce(
+            Subquery(reviews.annotate(total=Sum(name)).values('total')), 0
+        )
+    Listing.objects.update(**updates)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0002_initial'),
+        ('reviews', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='accuracy_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='check_in_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='cleanliness_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='communication_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='location_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='value_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
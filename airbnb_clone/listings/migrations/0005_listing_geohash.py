@@ -0,0 +1,28 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:44
+
+from django.db import migrations, models
+from listings.geo import encode_geohash
+
+
+def backfill_geohash(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    listings = Listing.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    for listing in listings.only('pk', 'latitude', 'longitude').iterator():
+        listing.geohash = encode_geohash(float(listing.latitude), float(listing.longitude))
+        listing.save(update_fields=['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_listing_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:47
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+
+def backfill_amenity_mask(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    amenities = ('wifi', 'kitchen', 'parking', 'air_conditioning', 'heating', 'tv', 'pool', 'gym')
+    mask = Value(0)
+    for bit, name in enumerate(amenities):
+        mask = mask + Case(When(**{name: True}, then=Value(1 << bit)), default=Value(0))
+    Listing.objects.update(amenity_mask=mask)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_listing_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='amenity_mask',
+            field=models.PositiveSmallIntegerField(db_index=True, default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_amenity_mask, migrations.RunPython.noop),
+    ]
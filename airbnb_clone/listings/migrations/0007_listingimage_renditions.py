@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_listing_amenity_mask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listingimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -1,6 +1,168 @@
+import math
 from django.db import models
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt
 from django.conf import settings
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
+from airbnb_clone.images import rendition_urls
+from .geo import EARTH_RADIUS_KM, GEOHASH_PRECISION, bounding_box, covering_cells, encode_geohash
+
+# Bit order of Listing.amenity_mask; append new amenities, never reorder
+AMENITY_FIELDS = ('wifi', 'kitchen', 'parking', 'air_conditioning',
+                  'heating', 'tv', 'pool', 'gym')
+
+# (min, max) nightly price ranges reported as search facets; max None is open-ended
+PRICE_BUCKETS = ((0, 100), (100, 200), (200, 300), (300, 500), (500, None))
+
+# Columns a listing card shows, a search sorts on or an ETag stamps; everything else is deferred
+CARD_FIELDS = ('id', 'host', 'title', 'property_type', 'city', 'state', 'country',
+               'latitude', 'longitude', 'bedrooms', 'bathrooms', 'guests', 'price_per_night',
+               'rating_sum', 'review_count', 'created_at', 'updated_at')
+
+# Review sub-scores with a running sum on Listing, besides the overall rating
+RATING_CATEGORIES = ('cleanliness', 'communication', 'check_in', 'accuracy', 'location', 'value')
+
+def amenity_mask(names):
+    """Bitmask for a collection of amenity field names; unknown names are ignored"""
+    mask = 0
+    for bit, name in enumerate(AMENITY_FIELDS):
+        if name in names:
+            mask |= 1 << bit
+    return mask
+
+def masks_containing(mask):
+    """Every amenity mask that includes all the bits of mask"""
+    return [value for value in range(1 << len(AMENITY_FIELDS)) if value & mask == mask]
+
+class ListingQuerySet(models.QuerySet):
+    """Search helpers for listings"""
+    
+    def available_between(self, check_in, check_out):
+        """Exclude listings with a pending or confirmed booking, or a live hold, overlapping the stay"""
+        from bookings.models import BookedNight, live_nights
+        booked = BookedNight.objects.filter(
+            live_nights(),
+            listing=models.OuterRef('pk'),
+            night__gte=check_in,
+            night__lt=check_out,
+        )
+        return self.exclude(models.Exists(booked))
+    
+    def cards(self):
+        """Lean rows for list pages: card columns plus the cover image, with no prefetching"""
+        cover = (
+            ListingImage.objects.filter(listing=models.OuterRef('pk'))
+            .order_by('-is_primary', 'uploaded_at')
+        )
+        return self.only(*CARD_FIELDS).annotate(
+            primary_image=models.Subquery(cover.values('image')[:1]),
+            primary_image_renditions=models.Subquery(
+                cover.values('renditions')[:1], output_field=models.JSONField()
+            ),
+        )
+    
+    def with_amenities(self, names):
+        """Listings offering every named amenity, as an IN lookup on the indexed mask"""
+        mask = amenity_mask(names)
+        if not mask:
+            return self
+        return self.filter(amenity_mask__in=masks_containing(mask))
+    
+    def facet_counts(self):
+        """Counts per amenity, property type and price bucket, from one grouped query"""
+        price_bucket = models.Case(
+            *[
+                models.When(
+                    models.Q(price_per_night__gte=low) &
+                    (models.Q(price_per_night__lt=high) if high is not None else models.Q()),
+                    then=models.Value(index),
+                )
+                for index, (low, high) in enumerate(PRICE_BUCKETS)
+            ],
+            output_field=models.IntegerField(),
+        )
+        groups = (
+            self.order_by()
+            .annotate(price_bucket=price_bucket)
+            .values('amenity_mask', 'property_type', 'price_bucket')
+            .annotate(total=models.Count('pk'))
+        )
+        
+        amenities = dict.fromkeys(AMENITY_FIELDS, 0)
+        property_types = dict.fromkeys([value for value, _ in Listing.PROPERTY_TYPE_CHOICES], 0)
+        prices = [0] * len(PRICE_BUCKETS)
+        total = 0
+        for group in groups:
+            count = group['total']
+            total += count
+            for bit, name in enumerate(AMENITY_FIELDS):
+                if group['amenity_mask'] & (1 << bit):
+                    amenities[name] += count
+            property_types[group['property_type']] = property_types.get(group['property_type'], 0) + count
+            if group['price_bucket'] is not None:
+                prices[group['price_bucket']] += count
+        
+        return {
+            'total': total,
+            'amenities': amenities,
+            'property_type': property_types,
+            'price': [
+                {'min': low, 'max': high, 'count': count}
+                for (low, high), count in zip(PRICE_BUCKETS, prices)
+            ],
+        }
+    
+    def within_bbox(self, min_lat, min_lng, max_lat, max_lng):
+        """Listings inside a box, prefiltered on the indexed geohash column"""
+        if min_lng > max_lng:
+            # The box crosses the antimeridian
+            boxes = [(min_lat, min_lng, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lng)]
+        else:
+            boxes = [(min_lat, min_lng, max_lat, max_lng)]
+        
+        condition = models.Q()
+        for box in boxes:
+            cells = covering_cells(*box)
+            box_condition = models.Q(
+                latitude__range=(box[0], box[2]),
+                longitude__range=(box[1], box[3]),
+            )
+            if cells:
+                prefixes = models.Q()
+                for cell in cells:
+                    # A range over the fixed-length hashes can use the index, unlike LIKE
+                    prefixes |= models.Q(geohash__range=(
+                        cell.ljust(GEOHASH_PRECISION, '0'), cell.ljust(GEOHASH_PRECISION, 'z')
+                    ))
+                box_condition &= prefixes
+            condition |= box_condition
+        return self.filter(condition)
+    
+    def with_distances(self, latitude, longitude):
+        """Annotate distance_km, the great-circle distance from a point, computed in the database"""
+        # The haversine formula, as geo.haversine_km computes it
+        lat1 = math.radians(latitude)
+        lat2 = Radians(Cast('latitude', models.FloatField()))
+        delta_lng = Radians(Cast('longitude', models.FloatField())) - math.radians(longitude)
+        a = (
+            Power(Sin((lat2 - lat1) / 2), 2)
+            + math.cos(lat1) * Cos(lat2) * Power(Sin(delta_lng / 2), 2)
+        )
+        return self.annotate(distance_km=models.ExpressionWrapper(
+            2 * EARTH_RADIUS_KM * ASin(Sqrt(Least(a, models.Value(1.0)))),
+            output_field=models.FloatField(),
+        ))
+    
+    def near(self, latitude, longitude, radius_km):
+        """Listings within radius_km, annotated with distance_km; order by it for nearest first"""
+        # The box prefilter uses the geohash index; the exact radius is checked
+        # in SQL, so every match is kept and the keyset paginator can page by distance
+        return (
+            self.within_bbox(*bounding_box(latitude, longitude, radius_km))
+            .with_distances(latitude, longitude)
+            .filter(distance_km__lte=radius_km)
+        )
 
 class Listing(models.Model):
     """Model for property listings"""
@@ -27,6 +189,7 @@ class Listing(models.Model):
     zip_code = models.CharField(max_length=20)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     
     # Property details
     bedrooms = models.IntegerField()
@@ -43,25 +206,103 @@ class Listing(models.Model):
     tv = models.BooleanField(default=False)
     pool = models.BooleanField(default=False)
     gym = models.BooleanField(default=False)
+    amenity_mask = models.PositiveSmallIntegerField(default=0, db_index=True, editable=False)
+    
+    # Rating aggregates, maintained by reviews.models.Review
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    cleanliness_sum = models.PositiveIntegerField(default=0, editable=False)
+    communication_sum = models.PositiveIntegerField(default=0, editable=False)
+    check_in_sum = models.PositiveIntegerField(default=0, editable=False)
+    accuracy_sum = models.PositiveIntegerField(default=0, editable=False)
+    location_sum = models.PositiveIntegerField(default=0, editable=False)
+    value_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
     
     # Status
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ListingQuerySet.as_manager()
+    
     def __str__(self):
         return self.title
     
     def get_absolute_url(self):
         return reverse('listing_detail', kwargs={'pk': self.pk})
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Column values as loaded, so a save can tell what the row used to say
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = encode_geohash(float(self.latitude), float(self.longitude))
+        else:
+            self.geohash = ''
+        self.amenity_mask = amenity_mask([name for name in AMENITY_FIELDS if getattr(self, name)])
+        
+        # Derived columns follow their sources into partial saves
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if update_fields & {'latitude', 'longitude'}:
+                update_fields.add('geohash')
+            if update_fields & set(AMENITY_FIELDS):
+                update_fields.add('amenity_mask')
+            kwargs['update_fields'] = update_fields
+        
+        super().save(*args, **kwargs)
+    
+    @cached_property
+    def cover_urls(self):
+        """Rendition URLs of the cover image, read from the cards() annotations when present"""
+        if 'primary_image' in self.__dict__:
+            if not self.primary_image:
+                return None
+            return rendition_urls(
+                ListingImage._meta.get_field('image').storage,
+                self.primary_image,
+                self.primary_image_renditions or {},
+            )
+        cover = self.images.first()
+        return cover.urls if cover else None
     
     @property
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews:
-            return sum([review.rating for review in reviews]) / len(reviews)
+        if self.review_count:
+            return self.rating_sum / self.review_count
         return 0
     
+    @property
+    def rating_histogram(self):
+        """Review count and share per star rating, five stars first"""
+        return [
+            {
+                'stars': stars,
+                'count': getattr(self, f'rating_{stars}_count'),
+                'percent': round(100 * getattr(self, f'rating_{stars}_count') / self.review_count)
+                if self.review_count else 0,
+            }
+            for stars in range(5, 0, -1)
+        ]
+    
+    @property
+    def category_averages(self):
+        """Average sub-score per review category, or None before the first review"""
+        return {
+            name: round(getattr(self, f'{name}_sum') / self.review_count, 2) if self.review_count else None
+            for name in RATING_CATEGORIES
+        }
+    
     class Meta:
         ordering = ['-created_at']
 
@@ -72,9 +313,22 @@ class ListingImage(models.Model):
     caption = models.CharField(max_length=200, blank=True)
     is_primary = models.BooleanField(default=False)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Storage names of the generated sizes ('card.webp': ...) and the 'source' they were made from
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
     
     def __str__(self):
         return f"Image for {self.listing.title}"
     
+    @cached_property
+    def urls(self):
+        """Rendition URLs by size and format, plus the original"""
+        return rendition_urls(self.image.storage, self.image.name, self.renditions)
+    
     class Meta:
-        ordering = ['-is_primary', 'uploaded_at']
\ No newline at end of file
+        ordering = ['-is_primary', 'uploaded_at']
+
+def touch_listings(**filters):
+    """Bump updated_at on matching listings when something shown with them changes"""
+    # Conditional GETs stamp a listing by its updated_at, so image and rating
+    # changes made with update() must move it too
+    return Listing.objects.filter(**filters).update(updated_at=timezone.now())
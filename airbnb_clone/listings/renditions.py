@@ -0,0 +1,70 @@
+import logging
+from django.core.files.base import ContentFile
+from django.db import transaction
+from airbnb_clone import workers
+from airbnb_clone.images import render, rendition_extension
+from .models import ListingImage, touch_listings
+
+logger = logging.getLogger(__name__)
+
+RENDITION_DIR = 'listing_images/renditions'
+
+def _storage():
+    return ListingImage._meta.get_field('image').storage
+
+def rendition_name(image_id, key):
+    size = key.split('.')[0]
+    return f'{RENDITION_DIR}/{image_id}/{size}.{rendition_extension(key)}'
+
+def needs_renditions(image):
+    return bool(image.image) and image.renditions.get('source') != image.image.name
+
+def schedule_renditions(image):
+    """Generate renditions in the worker pool once the upload is committed"""
+    image_id, source = image.pk, image.image.name
+    transaction.on_commit(lambda: _submit(image_id, source))
+
+def _submit(image_id, source):
+    try:
+        with _storage().open(source, 'rb') as f:
+            data = f.read()
+    except OSError:
+        logger.warning('Listing image %s (%s) cannot be read', image_id, source)
+        return
+    workers.submit(render, data, callback=lambda future: _store_result(image_id, source, future))
+
+def _store_result(image_id, source, future):
+    try:
+        outputs = future.result()
+    except Exception:
+        logger.exception('Could not render listing image %s (%s)', image_id, source)
+        return
+    store_renditions(image_id, source, outputs)
+
+def store_renditions(image_id, source, outputs):
+    """Save encoded renditions and record them, unless the image changed meanwhile"""
+    storage = _storage()
+    names = {'source': source}
+    for key, data in outputs.items():
+        name = rendition_name(image_id, key)
+        storage.delete(name)
+        names[key] = storage.save(name, ContentFile(data))
+    updated = ListingImage.objects.filter(pk=image_id, image=source).update(renditions=names)
+    if not updated:
+        # Deleted or replaced while rendering; the files would be orphans
+        delete_renditions(names)
+    else:
+        touch_listings(images=image_id)
+    return updated
+
+def delete_renditions(renditions):
+    storage = _storage()
+    for key, name in renditions.items():
+        if key != 'source':
+            storage.delete(name)
+
+def generate_renditions(image):
+    """Render and store one image's renditions in this process"""
+    with _storage().open(image.image.name, 'rb') as f:
+        outputs = render(f.read())
+    return store_renditions(image.pk, image.image.name, outputs)
@@ -0,0 +1,191 @@
+# Full-text listing search. SQLite keeps an FTS5 table in step with Listing
+# through model signals; PostgreSQL queries a GIN-indexed tsvector expression
+# plus pg_trgm word similarity, so the database maintains the index itself.
+# Other backends fall back to the original icontains lookup.
+import difflib
+import re
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'listings_listing_search'
+VOCAB_TABLE = 'listings_listing_search_vocab'
+SEARCH_COLUMNS = ('title', 'city', 'state', 'country', 'description')
+# bm25 weights, in SEARCH_COLUMNS order
+COLUMN_WEIGHTS = (10.0, 8.0, 4.0, 4.0, 1.0)
+TRIGRAM_INDEXED_COLUMNS = ('title', 'city')
+MAX_TERMS = 8
+TYPO_CUTOFF = 0.75
+TYPO_MIN_LENGTH = 4
+TYPO_SUGGESTIONS = 3
+
+def tokenize(query):
+    """Split a free-text query into lowercase word tokens"""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+def search_listings(queryset, query):
+    """Filter a listing queryset by a free-text query, annotating search_rank (higher is better)"""
+    terms = tokenize(query)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        return _search_sqlite(queryset, terms)
+    if vendor == 'postgresql':
+        return _search_postgresql(queryset, terms)
+
+    text = ' '.join(terms)
+    return queryset.filter(
+        Q(title__icontains=text) |
+        Q(city__icontains=text) |
+        Q(state__icontains=text) |
+        Q(country__icontains=text)
+    ).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+# SQLite FTS5
+
+def _close_terms(cursor, term):
+    """Indexed terms within a small edit distance of term, for typo tolerance"""
+    if len(term) < TYPO_MIN_LENGTH:
+        return []
+    prefix = term[:2]
+    cursor.execute(
+        f'SELECT term FROM {VOCAB_TABLE} WHERE term >= %s AND term < %s',
+        [prefix, prefix + '\uffff'],
+    )
+    vocabulary = [row[0] for row in cursor.fetchall()]
+    return [
+        candidate for candidate in difflib.get_close_matches(
+            term, vocabulary, n=TYPO_SUGGESTIONS, cutoff=TYPO_CUTOFF
+        )
+        if candidate != term
+    ]
+
+def match_expression(terms):
+    """Build an FTS5 MATCH expression: every term as a prefix, OR'd with close spellings"""
+    clauses = []
+    with connection.cursor() as cursor:
+        for term in terms:
+            options = [f'"{term}"*'] + [f'"{close}"' for close in _close_terms(cursor, term)]
+            clauses.append(options[0] if len(options) == 1 else f'({" OR ".join(options)})')
+    return ' AND '.join(clauses)
+
+def _search_sqlite(queryset, terms):
+    expression = match_expression(terms)
+    listing_table = queryset.model._meta.db_table
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+    return queryset.filter(
+        pk__in=RawSQL(f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [expression])
+    ).annotate(search_rank=RawSQL(
+        f'SELECT -bm25({SEARCH_TABLE}, {weights}) FROM {SEARCH_TABLE} '
+        f'WHERE {SEARCH_TABLE} MATCH %s AND rowid = "{listing_table}"."id"',
+        [expression],
+        output_field=FloatField(),
+    ))
+
+def index_listing(listing):
+    """Write one listing into the search index"""
+    if connection.vendor != 'sqlite':
+        return
+    columns = ', '.join(SEARCH_COLUMNS)
+    placeholders = ', '.join(['%s'] * len(SEARCH_COLUMNS))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [listing.pk])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, {columns}) VALUES (%s, {placeholders})',
+            [listing.pk] + [getattr(listing, column) for column in SEARCH_COLUMNS],
+        )
+
+def unindex_listing(listing_id):
+    """Remove one listing from the search index"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [listing_id])
+
+def rebuild_index(using_connection=None):
+    """Repopulate the search index from the Listing table"""
+    conn = using_connection or connection
+    if conn.vendor != 'sqlite':
+        return
+    columns = ', '.join(SEARCH_COLUMNS)
+    with conn.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, {columns}) '
+            f'SELECT id, {columns} FROM listings_listing'
+        )
+
+# PostgreSQL tsvector + pg_trgm
+
+def search_vector():
+    """Weighted tsvector over the listing text; also the expression of the GIN index"""
+    from django.contrib.postgres.search import SearchVector
+    return (
+        SearchVector('title', weight='A', config='english') +
+        SearchVector('city', 'state', 'country', weight='B', config='english') +
+        SearchVector('description', weight='D', config='english')
+    )
+
+def search_indexes():
+    """Index definitions backing the PostgreSQL search"""
+    from django.contrib.postgres.indexes import GinIndex, OpClass
+    from django.db.models.functions import Lower
+    indexes = [GinIndex(search_vector(), name='listing_search_vector_idx')]
+    for column in TRIGRAM_INDEXED_COLUMNS:
+        indexes.append(GinIndex(
+            OpClass(Lower(column), name='gin_trgm_ops'),
+            name=f'listing_{column}_trgm_idx',
+        ))
+    return indexes
+
+def _search_postgresql(queryset, terms):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+    from django.db.models.functions import Greatest, Lower
+    query = SearchQuery(
+        ' & '.join(f'{term}:*' for term in terms), search_type='raw', config='english'
+    )
+    text = ' '.join(terms)
+    vector = search_vector()
+    matches = Q(search_document=query)
+    for column in TRIGRAM_INDEXED_COLUMNS:
+        matches |= Q(**{f'{column}_lower__trigram_word_similar': text})
+    return queryset.alias(
+        search_document=vector,
+        **{f'{column}_lower': Lower(column) for column in TRIGRAM_INDEXED_COLUMNS},
+    ).filter(matches).annotate(search_rank=Greatest(
+        SearchRank(vector, query),
+        *[TrigramWordSimilarity(Value(text), f'{column}_lower') for column in TRIGRAM_INDEXED_COLUMNS],
+        output_field=FloatField(),
+    ))
+
+# Migrations
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        columns = ', '.join(SEARCH_COLUMNS)
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+            f"{columns}, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {VOCAB_TABLE} USING fts5vocab({SEARCH_TABLE}, 'row')"
+        )
+        rebuild_index(schema_editor.connection)
+    elif vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        Listing = apps.get_model('listings', 'Listing')
+        for index in search_indexes():
+            schema_editor.add_index(Listing, index)
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {VOCAB_TABLE}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+    elif vendor == 'postgresql':
+        Listing = apps.get_model('listings', 'Listing')
+        for index in search_indexes():
+            schema_editor.remove_index(Listing, index)
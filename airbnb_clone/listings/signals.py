@@ -0,0 +1,42 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .cache import invalidate_listing
+from .models import Listing, ListingImage, touch_listings
+from .renditions import delete_renditions, needs_renditions, schedule_renditions
+from .search import index_listing, unindex_listing
+
+@receiver(post_save, sender=Listing)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    """Keep the full-text index in step with the listing"""
+    if not raw:
+        index_listing(instance)
+
+@receiver(post_delete, sender=Listing)
+def remove_from_search_index(sender, instance, **kwargs):
+    """Drop a deleted listing from the full-text index"""
+    unindex_listing(instance.pk)
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def expire_cached_searches(sender, instance, raw=False, **kwargs):
+    """Expire cached search results the listing could appear in"""
+    if not raw:
+        invalidate_listing(instance)
+
+@receiver(post_save, sender=ListingImage)
+def render_listing_image(sender, instance, raw=False, **kwargs):
+    """Queue thumbnail, card and full-size renditions of a new or replaced image"""
+    if not raw and needs_renditions(instance):
+        schedule_renditions(instance)
+
+@receiver(post_save, sender=ListingImage)
+@receiver(post_delete, sender=ListingImage)
+def touch_image_listing(sender, instance, raw=False, **kwargs):
+    """Mark the listing changed when one of its images is added, edited or removed"""
+    if not raw:
+        touch_listings(pk=instance.listing_id)
+
+@receiver(post_delete, sender=ListingImage)
+def remove_listing_image_renditions(sender, instance, **kwargs):
+    """Delete the rendition files of a deleted image"""
+    delete_renditions(instance.renditions)
@@ -1,12 +1,31 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.contrib.messages import get_messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
-from django.db.models import Q, Avg
+from django.db.models import Q, Avg, Max
+from django.utils.dateparse import parse_date
+from django.http import Http404
+from airbnb_clone.conditional import not_modified, set_validators, validators
+from airbnb_clone.pagination import CursorPage, InvalidCursor, KeysetPaginator, wants_count
+from .cache import cache_key, get_or_compute, rows_in_order
 from .models import Listing, ListingImage
 from .forms import ListingForm, ListingImageForm, ListingSearchForm
+from .geo import parse_bbox, parse_point, parse_radius
+from .search import search_listings
+
+def parse_stay_dates(params):
+    """Return the (check_in, check_out) dates from query params, or None if incomplete"""
+    try:
+        check_in = parse_date(params.get('check_in') or '')
+        check_out = parse_date(params.get('check_out') or '')
+    except ValueError:
+        return None
+    if check_in and check_out and check_in < check_out:
+        return check_in, check_out
+    return None
 
 class ListingListView(ListView):
     """View for listing all properties"""
@@ -14,10 +33,19 @@ class ListingListView(ListView):
     template_name = 'listings/listing_list.html'
     context_object_name = 'listings'
     paginate_by = 20
+    cursor_kwarg = 'cursor'
     
     def get_queryset(self):
-        queryset = Listing.objects.filter(is_active=True).prefetch_related('images', 'reviews')
-        
+        return Listing.objects.filter(is_active=True).cards()
+    
+    def search(self, queryset):
+        """Apply the search filters and ordering; only run when the result is not cached"""
+        if hasattr(self, '_search_queryset'):
+            return self._search_queryset
+        self._search_queryset = queryset = self._search(queryset)
+        return queryset
+    
+    def _search(self, queryset):
         # Search functionality
         location = self.request.GET.get('location')
         guests = self.request.GET.get('guests')
@@ -26,14 +54,18 @@ class ListingListView(ListView):
         bedrooms = self.request.GET.get('bedrooms')
         bathrooms = self.request.GET.get('bathrooms')
         property_type = self.request.GET.get('property_type')
+        stay = parse_stay_dates(self.request.GET)
+        near = parse_point(self.request.GET.get('near'))
+        bbox = parse_bbox(self.request.GET.get('bbox'))
+        amenities = [
+            name for value in self.request.GET.getlist('amenities') for name in value.split(',')
+        ]
         
         if location:
-            queryset = queryset.filter(
-                Q(city__icontains=location) | 
-                Q(state__icontains=location) | 
-                Q(country__icontains=location) |
-                Q(title__icontains=location)
-            )
+            queryset = search_listings(queryset, location)
+        
+        if stay:
+            queryset = queryset.available_between(*stay)
         
         if guests:
             queryset = queryset.filter(guests__gte=guests)
@@ -53,11 +85,63 @@ class ListingListView(ListView):
         if property_type:
             queryset = queryset.filter(property_type=property_type)
         
+        if amenities:
+            queryset = queryset.with_amenities(amenities)
+        
+        if bbox:
+            queryset = queryset.within_bbox(*bbox)
+        
+        # Applied last, so nearest-first ordering wins
+        if near:
+            queryset = queryset.near(*near, parse_radius(self.request.GET.get('radius_km')))
+            return queryset.order_by('distance_km')
+        
+        if location:
+            return queryset.order_by('-search_rank', '-created_at')
         return queryset.order_by('-created_at')
     
+    def paginate_queryset(self, queryset, page_size):
+        # Cache the page as ids plus cursors; a hit re-reads only those rows
+        cursor = self.request.GET.get(self.cursor_kwarg)
+        computed = {}
+        
+        def compute():
+            paginator = KeysetPaginator(self.search(queryset), page_size)
+            try:
+                page = paginator.page(cursor, with_count=wants_count(self.request.GET))
+            except InvalidCursor as e:
+                raise Http404(str(e))
+            computed['rows'] = page.object_list
+            return {
+                'ids': [listing.pk for listing in page.object_list],
+                'next': page.next_cursor,
+                'previous': page.previous_cursor,
+                'count': page.count,
+            }
+        
+        result = get_or_compute(cache_key(f'html:{page_size}', self.request.GET), compute)
+        rows = computed.get('rows')
+        if rows is None:
+            # Keep the radius search's distances on the re-read rows
+            near = parse_point(self.request.GET.get('near'))
+            if near:
+                queryset = queryset.with_distances(*near)
+            rows = rows_in_order(queryset, result['ids'])
+        page = CursorPage(rows, result['next'], result['previous'], result['count'])
+        return None, page, page.object_list, page.has_other_pages()
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['search_form'] = ListingSearchForm(self.request.GET)
+        context['facets'] = facets = get_or_compute(
+            cache_key('html-facets', self.request.GET, ignore=(self.cursor_kwarg, 'count')),
+            lambda: self.search(self.object_list).facet_counts(),
+        )
+        context['amenity_facets'] = [
+            (name, Listing._meta.get_field(name).verbose_name, count)
+            for name, count in facets['amenities'].items()
+        ]
+        context['selected_amenities'] = self.request.GET.getlist('amenities')
         return context
 
 class ListingDetailView(DetailView):
@@ -66,10 +150,34 @@ class ListingDetailView(DetailView):
     template_name = 'listings/listing_detail.html'
     context_object_name = 'listing'
     
+    def get(self, request, *args, **kwargs):
+        # Stamp the page from one small query, so a matching If-None-Match skips
+        # loading the images and reviews and rendering the template. Image and
+        # rating changes move the listing's updated_at, and the reviewers' stamps
+        # cover the names and avatars shown; pending flash messages always render.
+        stamps = (
+            Listing.objects.filter(pk=kwargs['pk']).order_by('pk')
+            .values_list('updated_at', 'host__updated_at')
+            .annotate(
+                latest_review=Max('reviews__updated_at'),
+                latest_reviewer=Max('reviews__reviewer__updated_at'),
+            )
+            .first()
+        )
+        if stamps is None or len(get_messages(request)):
+            return super().get(request, *args, **kwargs)
+        
+        etag, last_modified = validators(request.user.pk, kwargs['pk'], *stamps)
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['images'] = self.object.images.all()
-        context['reviews'] = self.object.reviews.select_related('reviewer').all()
+        # The count and rating come from the listing's aggregates; show only the latest few
+        context['reviews'] = self.object.reviews.select_related('reviewer')[:3]
         return context
 
 class ListingCreateView(LoginRequiredMixin, CreateView):
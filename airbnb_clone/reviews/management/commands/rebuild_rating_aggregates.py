@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from listings.models import Listing
+from reviews.models import rebuild_listing_ratings
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized rating aggregates on listings from their reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--listing', type=int, action='append', dest='listing_ids',
+                            help='Only rebuild the given listing id (repeatable)')
+
+    def handle(self, *args, **options):
+        listings = Listing.objects.all()
+        if options['listing_ids']:
+            listings = listings.filter(pk__in=options['listing_ids'])
+        
+        with transaction.atomic():
+            updated = rebuild_listing_ratings(listings)
+        
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} listings')
+        )
@@ -1,9 +1,57 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
-from listings.models import Listing
+from django.utils import timezone
+from listings.models import RATING_CATEGORIES, Listing
 from bookings.models import Booking
 
+# Score fields mirrored as running sums on Listing
+RATING_FIELDS = ('rating',) + RATING_CATEGORIES
+
+# Possible values of a score; Listing counts reviews per overall rating
+STARS = range(1, 6)
+
+def aggregate_field(name):
+    """Name of the Listing column holding the running sum of a score field"""
+    return 'rating_sum' if name == 'rating' else f'{name}_sum'
+
+def histogram_field(stars):
+    """Name of the Listing column counting reviews with an overall rating of stars"""
+    return f'rating_{stars}_count'
+
+def update_listing_ratings(listing_id, deltas, count_delta, star_deltas=None):
+    """Apply score and star-count deltas to a listing's rating aggregates in a single UPDATE"""
+    # Moves updated_at too, as the listing's ETag depends on its ratings
+    updates = {'review_count': F('review_count') + count_delta, 'updated_at': timezone.now()}
+    for name in RATING_FIELDS:
+        column = aggregate_field(name)
+        updates[column] = F(column) + deltas[name]
+    for stars, delta in (star_deltas or {}).items():
+        column = histogram_field(stars)
+        updates[column] = F(column) + delta
+    Listing.objects.filter(pk=listing_id).update(**updates)
+
+def rebuild_listing_ratings(listings=None):
+    """Recompute rating aggregates from the Review table in one UPDATE"""
+    reviews = Review.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+    updates = {
+        'review_count': Coalesce(Subquery(reviews.annotate(total=Count('pk')).values('total')), 0),
+        'updated_at': timezone.now(),
+    }
+    for name in RATING_FIELDS:
+        updates[aggregate_field(name)] = Coalesce(
+            Subquery(reviews.annotate(total=Sum(name)).values('total')), 0
+        )
+    for stars in STARS:
+        updates[histogram_field(stars)] = Coalesce(
+            Subquery(reviews.filter(rating=stars).annotate(total=Count('pk')).values('total')), 0
+        )
+    if listings is None:
+        listings = Listing.objects.all()
+    return listings.update(**updates)
+
 class Review(models.Model):
     """Model for property reviews"""
     booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name='review')
@@ -27,6 +75,37 @@ class Review(models.Model):
     def __str__(self):
         return f"Review by {self.reviewer.username} for {self.listing.title}"
     
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                previous = Review.objects.select_for_update().filter(pk=self.pk).values(
+                    'listing_id', *RATING_FIELDS
+                ).first()
+            
+            super().save(*args, **kwargs)
+            
+            scores = self.scores
+            if previous is None:
+                update_listing_ratings(self.listing_id, scores, 1, {self.rating: 1})
+            elif previous['listing_id'] == self.listing_id:
+                deltas = {name: scores[name] - previous[name] for name in RATING_FIELDS}
+                if any(deltas.values()):
+                    star_deltas = None
+                    if deltas['rating']:
+                        star_deltas = {previous['rating']: -1, self.rating: 1}
+                    update_listing_ratings(self.listing_id, deltas, 0, star_deltas)
+            else:
+                update_listing_ratings(
+                    previous['listing_id'],
+                    {name: -previous[name] for name in RATING_FIELDS}, -1, {previous['rating']: -1}
+                )
+                update_listing_ratings(self.listing_id, scores, 1, {self.rating: 1})
+    
+    @property
+    def scores(self):
+        return {name: getattr(self, name) for name in RATING_FIELDS}
+    
     @property
     def average_rating(self):
         return (self.cleanliness + self.communication + self.check_in + 
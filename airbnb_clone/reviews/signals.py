@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from .models import Review, RATING_FIELDS, update_listing_ratings
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_listing_ratings(sender, instance, **kwargs):
+    """Subtract a deleted review from its listing's rating aggregates"""
+    update_listing_ratings(
+        instance.listing_id,
+        {name: -getattr(instance, name) for name in RATING_FIELDS}, -1, {instance.rating: -1}
+    )
@@ -4,9 +4,11 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import ListView, DetailView
 from django.utils import timezone
+from airbnb_clone.pagination import KeysetPaginationMixin
 from .models import Review
 from .forms import ReviewForm, HostResponseForm
 from bookings.models import Booking
+from listings.models import Listing
 
 @login_required
 def create_review(request, booking_pk):
@@ -65,7 +67,7 @@ def add_host_response(request, pk):
         'review': review
     })
 
-class ListingReviewsView(ListView):
+class ListingReviewsView(KeysetPaginationMixin, ListView):
     """View for displaying all reviews for a listing"""
     model = Review
     template_name = 'reviews/listing_reviews.html'
@@ -73,11 +75,16 @@ class ListingReviewsView(ListView):
     paginate_by = 10
     
     def get_queryset(self):
-        self.listing_pk = self.kwargs['listing_pk']
-        return Review.objects.filter(listing__pk=self.listing_pk)
+        # The listing row carries the rating histogram and category sums,
+        # so the summary needs no pass over the reviews
+        self.listing = get_object_or_404(Listing, pk=self.kwargs['listing_pk'])
+        return Review.objects.filter(listing=self.listing).select_related('reviewer')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        from listings.models import Listing
-        context['listing'] = get_object_or_404(Listing, pk=self.listing_pk)
+        context['listing'] = self.listing
+        context['category_averages'] = [
+            (Review._meta.get_field(name).verbose_name, average)
+            for name, average in self.listing.category_averages.items()
+        ]
         return context
\ No newline at end of file
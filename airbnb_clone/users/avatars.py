@@ -0,0 +1,95 @@
+import hashlib
+import logging
+import os
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from airbnb_clone import workers
+from airbnb_clone.images import AVATAR_SIZES, RENDITION_FORMATS, render_avatars, rendition_key
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+# Avatars are stored by the SHA-256 of the source picture, so every user with
+# the same picture (above all the shared default) shares one set of files
+AVATAR_DIR = 'profile_pics/avatars'
+
+def _storage():
+    return User._meta.get_field('profile_picture').storage
+
+def avatar_names(digest):
+    return {
+        rendition_key(size, fmt): f'{AVATAR_DIR}/{digest}/{size}.{extension}'
+        for size in AVATAR_SIZES
+        for fmt, (_, extension, _) in RENDITION_FORMATS.items()
+    }
+
+def deduplicate_upload(user):
+    """Store a new upload under its content hash, reusing an identical file if one exists"""
+    picture = user.profile_picture
+    digest = hashlib.sha256()
+    for chunk in picture.file.chunks():
+        digest.update(chunk)
+    picture.file.seek(0)
+    filename = f'{digest.hexdigest()}{os.path.splitext(picture.name)[1].lower()}'
+    name = picture.field.generate_filename(user, filename)
+    if picture.storage.exists(name):
+        user.profile_picture = name
+    else:
+        # Saved under this name when the model is
+        picture.name = filename
+
+def schedule_avatars(user):
+    """Generate avatar sizes in the worker pool once the picture change is committed"""
+    user_id, source = user.pk, user.profile_picture.name
+    transaction.on_commit(lambda: _submit(user_id, source))
+
+def _submit(user_id, source):
+    try:
+        with _storage().open(source, 'rb') as f:
+            data = f.read()
+    except OSError:
+        logger.warning('Profile picture %s of user %s cannot be read', source, user_id)
+        return
+    digest = hashlib.sha256(data).hexdigest()
+    if not record_existing_avatars(user_id, source, digest):
+        workers.submit(render_avatars, data, callback=lambda future: _store_result(user_id, source, digest, future))
+
+def _store_result(user_id, source, digest, future):
+    try:
+        outputs = future.result()
+    except Exception:
+        logger.exception('Could not render avatars for user %s (%s)', user_id, source)
+        return
+    store_avatars(user_id, source, digest, outputs)
+
+def _record(user_id, source, digest, names):
+    avatars = {'source': source, 'hash': digest, **names}
+    return User.objects.filter(pk=user_id, profile_picture=source).update(avatars=avatars, updated_at=timezone.now())
+
+def record_existing_avatars(user_id, source, digest):
+    """Point the user at avatars already rendered from identical content, if any"""
+    storage = _storage()
+    names = avatar_names(digest)
+    if not all(storage.exists(name) for name in names.values()):
+        return False
+    _record(user_id, source, digest, names)
+    return True
+
+def store_avatars(user_id, source, digest, outputs):
+    """Save rendered avatars and record them, unless the picture changed meanwhile"""
+    storage = _storage()
+    names = avatar_names(digest)
+    for key, data in outputs.items():
+        if not storage.exists(names[key]):
+            names[key] = storage.save(names[key], ContentFile(data))
+    return _record(user_id, source, digest, names)
+
+def generate_avatars(user):
+    """Render and record one user's avatars in this process"""
+    source = user.profile_picture.name
+    with _storage().open(source, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if not record_existing_avatars(user.pk, source, digest):
+        store_avatars(user.pk, source, digest, render_avatars(data))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from users.avatars import generate_avatars
+from users.models import User
+
+class Command(BaseCommand):
+    help = 'Generates avatar sizes for profile pictures that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate avatars for every user')
+
+    def handle(self, *args, **options):
+        rendered = failed = 0
+        users = User.objects.exclude(profile_picture='').order_by('pk')
+        for user in users.iterator():
+            if not options['all'] and user.avatars.get('source') == user.profile_picture.name:
+                continue
+            try:
+                generate_avatars(user)
+            except OSError as e:
+                failed += 1
+                self.stderr.write(f'User {user.pk} ({user.profile_picture.name}): {e}')
+                continue
+            rendered += 1
+        
+        self.stdout.write(self.style.SUCCESS(f'Generated avatars for {rendered} users'))
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{failed} profile pictures could not be read'))
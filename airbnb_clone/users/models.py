@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
-from PIL import Image
+from django.utils.functional import cached_property
+from airbnb_clone.images import AVATAR_SIZES, rendition_urls
 
 class User(AbstractUser):
     """Custom User model extending Django's AbstractUser"""
@@ -16,6 +17,8 @@ class User(AbstractUser):
     bio = models.TextField(max_length=500, blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', default='default.jpg')
     date_of_birth = models.DateField(null=True, blank=True)
+    # Storage names of the avatar sizes ('small.webp': ...), the 'source' picture and its content 'hash'
+    avatars = models.JSONField(default=dict, blank=True, editable=False)
     is_verified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -23,16 +26,43 @@ class User(AbstractUser):
     def __str__(self):
         return self.username
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Column values as loaded, so a save can tell whether the picture changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def _profile_picture_changed(self, update_fields):
+        if update_fields is not None and 'profile_picture' not in update_fields:
+            return False
+        if 'profile_picture' in self.get_deferred_fields():
+            return False
+        if self._state.adding or not hasattr(self, '_loaded_values'):
+            return True
+        return self.profile_picture.name != self._loaded_values.get('profile_picture')
+    
     def save(self, *args, **kwargs):
+        # Only a new picture is processed; logins and profile edits skip image work
+        picture_changed = self._profile_picture_changed(kwargs.get('update_fields'))
+        if picture_changed and self.profile_picture and not self.profile_picture._committed:
+            from .avatars import deduplicate_upload
+            deduplicate_upload(self)
+        
         super().save(*args, **kwargs)
         
-        # Resize profile picture
-        if self.profile_picture:
-            img = Image.open(self.profile_picture.path)
-            if img.height > 300 or img.width > 300:
-                output_size = (300, 300)
-                img.thumbnail(output_size)
-                img.save(self.profile_picture.path)
+        if picture_changed:
+            self._loaded_values = {**getattr(self, '_loaded_values', {}), 'profile_picture': self.profile_picture.name}
+            if self.profile_picture:
+                from .avatars import schedule_avatars
+                schedule_avatars(self)
+    
+    @cached_property
+    def avatar_urls(self):
+        """Square avatar URLs by size and format, falling back to the original picture"""
+        if not self.profile_picture:
+            return None
+        return rendition_urls(self.profile_picture.storage, self.profile_picture.name, self.avatars, AVATAR_SIZES)
     
     class Meta:
         ordering = ['-created_at']
\ No newline at end of file
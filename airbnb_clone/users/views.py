@@ -64,4 +64,9 @@ class UserDetailView(DetailView):
     """View for displaying user public profile"""
     model = User
     template_name = 'users/user_detail.html'
-    context_object_name = 'profile_user'
\ No newline at end of file
+    context_object_name = 'profile_user'
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['listings'] = self.object.listings.filter(is_active=True).cards()
+        return context
\ No newline at end of file